@@ -0,0 +1,167 @@
+import random
+import time
+from itertools import count
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, transaction
+from django.db.utils import load_backend
+from django.db.models import Prefetch, prefetch_related_objects
+
+from recipes.models import Ingredient, IngredientAmount, Recipe
+
+from .fragments import render_recipes
+from .search import ingredient_index
+from .serializers import RecipeReadOnlySerializer, RecipeWriteSerializer
+
+User = get_user_model()
+
+BENCHMARKS = {}
+
+
+def register(name):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+@register('ingredient_search')
+def ingredient_search(repeat):
+    """Autocomplete lookups: SQL ``istartswith`` against the index."""
+    names = list(Ingredient.objects.values_list('name', flat=True))
+    if not names:
+        return
+    generator = random.Random(0)
+    queries = [name[:generator.randint(1, 4)]
+               for name in generator.choices(names, k=repeat)]
+    ingredient_index.search('')
+    sql_queries = iter(queries)
+    yield 'sql', measure(lambda: list(
+        Ingredient.objects.filter(
+            name__istartswith=next(sql_queries)
+        ).values('id', 'name', 'measurement_unit')
+    ), repeat)
+    index_queries = iter(queries)
+    yield 'index', measure(
+        lambda: ingredient_index.search(next(index_queries)), repeat)
+
+
+@register('recipe_update')
+def recipe_update(repeat, size=50):
+    """Changing one amount of a recipe: rewrite every row or write a diff.
+
+    Runs in a transaction that is rolled back afterwards.
+    """
+    author = User.objects.first()
+    ingredients = list(Ingredient.objects.all()[:size])
+    if author is None or len(ingredients) < size:
+        return
+    with transaction.atomic():
+        recipe = Recipe.objects.create(
+            author=author, name='benchmark', text='benchmark',
+            cooking_time=1, image='images/benchmark.png')
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients)
+        steps = count()
+
+        def submitted():
+            amount = 1 + next(steps) % 2
+            return [{'id': ingredient, 'amount': amount if position == 0
+                     else 1}
+                    for position, ingredient in enumerate(ingredients)]
+
+        def rewrite():
+            parts = submitted()
+            recipe.ingredients.clear()
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipe=recipe, ingredient=part['id'],
+                                 amount=part['amount'])
+                for part in parts)
+
+        serializer = RecipeWriteSerializer()
+        yield 'rewrite', measure(rewrite, repeat)
+        yield 'diff', measure(
+            lambda: serializer.update_ingredients(recipe, submitted()),
+            repeat)
+        transaction.set_rollback(True)
+
+
+@register('recipe_fragments')
+def recipe_fragments(repeat, size=100):
+    """A 100 recipe page: DRF serializers or ``render_recipes``.
+
+    ``render_recipes`` runs without the cache, building every fragment
+    from values() rows, and with a warm one. The uncached sides include
+    their tags and ingredients queries.
+    """
+    recipes = list(Recipe.objects.select_related('author').with_user_flags(
+        User.objects.first() or AnonymousUser()
+    ).order_by('-pub_date', '-id')[:size])
+    if not recipes:
+        return
+
+    def serializers():
+        prefetch_related_objects(recipes, 'tags', Prefetch(
+            'recipe_amount',
+            queryset=IngredientAmount.objects.select_related(
+                'ingredient').order_by('id')))
+        RecipeReadOnlySerializer(
+            recipes, many=True, context={'request': None}).data
+        for recipe in recipes:
+            recipe._prefetched_objects_cache = {}
+
+    yield 'serializer', measure(serializers, repeat)
+    yield 'uncached', measure(
+        lambda: render_recipes(recipes, None, cached=False), repeat)
+    render_recipes(recipes, None)
+    yield 'cached', measure(lambda: render_recipes(recipes, None), repeat)
+
+
+@register('db_connection')
+def db_connection(repeat):
+    """Connection handling of a one-query request.
+
+    A new connection per request, a persistent one health-checked before
+    its first query, and one taken from the pool and returned to it.
+    Each side uses its own ``DatabaseWrapper`` built from the default
+    settings.
+    """
+    engine = connection.settings_dict['ENGINE']
+    if engine not in settings.DB_BACKENDS.values():
+        return
+
+    def wrapper(alias, **overrides):
+        settings_dict = dict(connection.settings_dict, **overrides)
+        return load_backend(engine).DatabaseWrapper(settings_dict, alias)
+
+    def request(database):
+        def run():
+            with database.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            database.close_if_unusable_or_obsolete()
+        return run
+
+    no_pool = {'MAX_SIZE': 0}
+    sides = (
+        ('connect', wrapper('benchmark-connect', CONN_MAX_AGE=0,
+                            POOL=no_pool)),
+        ('persistent', wrapper('benchmark-persistent', CONN_MAX_AGE=None,
+                               HEALTH_CHECKS=True, POOL=no_pool)),
+        ('pooled', wrapper('benchmark-pool', CONN_MAX_AGE=0,
+                           POOL={'MAX_SIZE': 1, 'WAIT_TIMEOUT': 1})),
+    )
+    for label, database in sides:
+        yield label, measure(request(database), repeat)
+        database.close()
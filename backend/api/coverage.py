@@ -0,0 +1,107 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from recipes.models import IngredientAmount
+
+from .versions import VersionedValue, bump_version
+
+
+class CoverageIndex(VersionedValue):
+    """Inverted index from ingredient to the recipes that use it.
+
+    Every ingredient maps to a sorted array of recipe ids, and every
+    recipe to its number of ingredients, so ranking recipes by how many
+    ingredients are missing never touches ``IngredientAmount``. Changes
+    made in this process patch the index in place; when another process
+    changed the data as well, the index is rebuilt on next use.
+    """
+
+    version_name = 'recipe_ingredients'
+
+    def build(self):
+        postings, sizes = {}, Counter()
+        rows = IngredientAmount.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id').iterator()
+        for ingredient_id, recipe_id in rows:
+            postings.setdefault(ingredient_id, array('I')).append(recipe_id)
+            sizes[recipe_id] += 1
+        return postings, sizes
+
+    def rank(self, ingredient_ids, limit, recipe_ids=None):
+        """Best ``limit`` recipes as ``(recipe_id, missing)`` pairs.
+
+        When ``recipe_ids`` is given only those recipes are ranked.
+        """
+        postings, sizes = self.get()
+        with self._lock:
+            covered = Counter()
+            for ingredient_id in set(ingredient_ids):
+                covered.update(postings.get(ingredient_id, ()))
+            if recipe_ids is not None:
+                covered = {recipe_id: count
+                           for recipe_id, count in covered.items()
+                           if recipe_id in recipe_ids}
+            return [
+                (recipe_id, sizes[recipe_id] - count)
+                for recipe_id, count in heapq.nsmallest(
+                    limit, covered.items(),
+                    key=lambda item: (sizes[item[0]] - item[1],
+                                      -item[1], -item[0]))
+            ]
+
+    def update_recipe(self, recipe_id, ingredient_ids):
+        """Replace the ingredients of a recipe in the index."""
+        postings, sizes = self.get()
+        with self._lock:
+            if sizes.get(recipe_id):
+                for recipe_ids in postings.values():
+                    self._discard(recipe_ids, recipe_id)
+                del sizes[recipe_id]
+            for ingredient_id in set(ingredient_ids):
+                self._add(postings, sizes, recipe_id, ingredient_id)
+            self._commit_version()
+
+    def add(self, recipe_id, ingredient_id):
+        postings, sizes = self.get()
+        with self._lock:
+            self._add(postings, sizes, recipe_id, ingredient_id)
+            self._commit_version()
+
+    def discard(self, recipe_id, ingredient_id):
+        postings, sizes = self.get()
+        with self._lock:
+            if self._discard(postings.get(ingredient_id, ()), recipe_id):
+                sizes[recipe_id] -= 1
+                if not sizes[recipe_id]:
+                    del sizes[recipe_id]
+            self._commit_version()
+
+    def _add(self, postings, sizes, recipe_id, ingredient_id):
+        recipe_ids = postings.setdefault(ingredient_id, array('I'))
+        position = bisect_left(recipe_ids, recipe_id)
+        if (position == len(recipe_ids)
+                or recipe_ids[position] != recipe_id):
+            recipe_ids.insert(position, recipe_id)
+            sizes[recipe_id] += 1
+
+    def _discard(self, recipe_ids, recipe_id):
+        position = bisect_left(recipe_ids, recipe_id)
+        if position < len(recipe_ids) and recipe_ids[position] == recipe_id:
+            del recipe_ids[position]
+            return True
+        return False
+
+    def _commit_version(self):
+        # The index already holds this change, so adopt the new version
+        # unless another process changed the data in the meantime.
+        version = bump_version(self.version_name)
+        if self._version is not None and version == self._version + 1:
+            self._version = version
+        else:
+            self._version = None
+
+
+coverage_index = CoverageIndex()
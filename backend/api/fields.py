@@ -0,0 +1,151 @@
+import base64
+import binascii
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+# Multiple of 4, so every slice of the payload decodes on its own.
+DECODE_CHUNK_SIZE = 64 * 1024
+IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+def rendition_urls(recipe, request=None):
+    renditions = recipe.image_renditions
+    if renditions.get('source') != recipe.image.name:
+        return {}
+    urls = {}
+    for key, name in renditions.items():
+        if key == 'source':
+            continue
+        url = default_storage.url(name)
+        urls[key] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+class RenditionsField(serializers.Field):
+    """URLs of the resized copies of a recipe image.
+
+    Renditions built for a previous image are skipped until the new
+    ones are ready, so clients fall back to ``image``.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', '*')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return rendition_urls(recipe, self.context.get('request'))
+
+
+class Base64ImageField(serializers.ImageField):
+    """Image sent as a base64 string or a ``data:`` URI.
+
+    The size is checked from the encoded length before decoding, the
+    payload is decoded chunk by chunk into a temporary file, and only
+    the image header is read to check format and dimensions.
+    """
+
+    default_error_messages = {
+        'invalid': 'Upload a valid base64 encoded image.',
+        'too_large': 'Image must not exceed {max_size} bytes.',
+        'too_many_pixels': 'Image must not exceed {max_pixels} pixels.',
+        'invalid_image': 'Upload a valid image. The file you uploaded was '
+                         'either not an image or a corrupted image.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid')
+        offset = data.find(',') + 1 if data.startswith('data:') else 0
+        padding = data[-2:].count('=')
+        size = (len(data) - offset) * 3 // 4 - padding
+        if size > settings.MAX_IMAGE_SIZE:
+            self.fail('too_large', max_size=settings.MAX_IMAGE_SIZE)
+        file = TemporaryUploadedFile(
+            'upload', 'application/octet-stream', size, None)
+        try:
+            self.decode(data, offset, file)
+            image_format, pixels = self.read_header(file)
+        except serializers.ValidationError:
+            file.close()
+            raise
+        if pixels > settings.MAX_IMAGE_PIXELS:
+            file.close()
+            self.fail('too_many_pixels',
+                      max_pixels=settings.MAX_IMAGE_PIXELS)
+        file.name = f'{uuid.uuid4()}.{IMAGE_FORMATS[image_format]}'
+        file.content_type = Image.MIME[image_format]
+        return file
+
+    def decode(self, data, offset, file):
+        try:
+            for start in range(offset, len(data), DECODE_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    data[start:start + DECODE_CHUNK_SIZE], validate=True))
+        except (binascii.Error, ValueError):
+            self.fail('invalid')
+        file.flush()
+        file.seek(0)
+
+    def read_header(self, file):
+        try:
+            with Image.open(file.temporary_file_path()) as image:
+                image_format, (width, height) = image.format, image.size
+        except Exception:
+            self.fail('invalid_image')
+        if image_format not in IMAGE_FORMATS:
+            self.fail('invalid_image')
+        return image_format, width * height
+
+
+def in_bulk(queryset, pks):
+    """Objects for ``pks``, in order, fetched with a single query.
+
+    Every unknown key is reported in one validation error.
+    """
+    objects = queryset.in_bulk(set(pks))
+    missing = [pk for pk in dict.fromkeys(pks) if pk not in objects]
+    if missing:
+        raise serializers.ValidationError(
+            'Objects do not exist: {}.'.format(', '.join(map(str, missing))))
+    return [objects[pk] for pk in pks]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        if any(item is None for item in data):
+            self.child_relation.fail('null')
+        return in_bulk(self.child_relation.get_queryset(),
+                       [self.child_relation.to_pk(item) for item in data])
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """``PrimaryKeyRelatedField`` resolving ``many=True`` in one query."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except DjangoValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
@@ -1,14 +1,19 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Case, IntegerField, When
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
 
 from recipes.models import Recipe, Tag
 
+from .coverage import coverage_index
+
 User = get_user_model()
+COVERAGE_RESULTS = 1000
+# Filters that order results by relevance instead of publication date.
+RANKED_FILTERS = ('search', 'ingredients')
 
 
-class IngredientFilter(SearchFilter):
-    search_param = 'name'
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
 
 
 class RecipeFilter(filters.FilterSet):
@@ -18,15 +23,24 @@ class RecipeFilter(filters.FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='tags_filter',
     )
     is_favorited = filters.NumberFilter(
         method='favorited_filter')
     is_in_shopping_cart = filters.NumberFilter(
         method='shopping_cart_filter')
+    search = filters.CharFilter(method='search_filter')
+    ingredients = NumberInFilter(method='coverage_filter')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ingredients')
+
+    def tags_filter(self, queryset, name, value):
+        if value:
+            return queryset.with_tags(value)
+        return queryset
 
     def favorited_filter(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -37,3 +51,33 @@ class RecipeFilter(filters.FilterSet):
         if self.request.user.is_authenticated and value:
             return queryset.filter(in_cart__author=self.request.user)
         return queryset
+
+    def search_filter(self, queryset, name, value):
+        if value.strip():
+            return queryset.search(value.strip())
+        return queryset
+
+    def coverage_filter(self, queryset, name, value):
+        """Recipes using any of the given ingredients, fewest missing first.
+
+        Ranking is done by the in-memory ``coverage_index``; only the
+        best ``COVERAGE_RESULTS`` recipes reach the database. The filter
+        is declared last, so when other filters narrowed the queryset
+        only the recipes they let through are ranked.
+        """
+        recipe_ids = None
+        if queryset.query.has_filters():
+            recipe_ids = set(queryset.order_by().values_list(
+                'id', flat=True))
+        ranked = coverage_index.rank(
+            [int(ingredient_id) for ingredient_id in value],
+            COVERAGE_RESULTS, recipe_ids)
+        if not ranked:
+            return queryset.none()
+        return queryset.filter(
+            id__in=[recipe_id for recipe_id, _ in ranked]
+        ).annotate(coverage_rank=Case(
+            *[When(id=recipe_id, then=position)
+              for position, (recipe_id, _) in enumerate(ranked)],
+            output_field=IntegerField(),
+        )).order_by('coverage_rank')
@@ -0,0 +1,124 @@
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import IngredientAmount, Recipe
+
+from .fields import rendition_urls
+from .versions import get_version
+
+KEY = 'recipe-fragment:{}:{}'
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+TAG_COLUMNS = ('tag_id', 'tag__name', 'tag__color', 'tag__slug')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit', 'amount')
+INGREDIENT_COLUMNS = ('ingredient_id', 'ingredient__name',
+                      'ingredient__measurement_unit', 'amount')
+
+
+def fragment_key(recipe, versions):
+    """Cache key that changes with everything the fragment shows.
+
+    ``updated_at`` follows the recipe, its tags and ingredient amounts,
+    the versions follow tag and ingredient renames, and the author
+    profile is part of the digest.
+    """
+    author = recipe.author
+    digest = hashlib.sha1(repr((
+        recipe.updated_at.isoformat(), versions, author.email,
+        author.username, author.first_name, author.last_name,
+    )).encode()).hexdigest()
+    return KEY.format(recipe.pk, digest)
+
+
+def build_fragments(recipes):
+    """Viewer-independent representations with relative media URLs.
+
+    Same JSON as ``RecipeReadOnlySerializer``, but tags and ingredient
+    amounts are read as flat ``values_list`` rows and everything is
+    assembled into plain dicts, without model instances or serializer
+    fields per nested row. Viewer flags are left ``False``.
+    """
+    recipe_ids = [recipe.pk for recipe in recipes]
+    tags, ingredients = defaultdict(list), defaultdict(list)
+    tag_rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag__name').values_list('recipe_id', *TAG_COLUMNS)
+    for recipe_id, *row in tag_rows:
+        tags[recipe_id].append(dict(zip(TAG_FIELDS, row)))
+    ingredient_rows = IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('id').values_list('recipe_id', *INGREDIENT_COLUMNS)
+    for recipe_id, *row in ingredient_rows:
+        ingredients[recipe_id].append(dict(zip(INGREDIENT_FIELDS, row)))
+    fragments = {}
+    for recipe in recipes:
+        author = recipe.author
+        fragments[recipe.pk] = {
+            'id': recipe.pk,
+            'tags': tags[recipe.pk],
+            'author': {
+                'email': author.email,
+                'id': author.pk,
+                'username': author.username,
+                'first_name': author.first_name,
+                'last_name': author.last_name,
+                'is_subscribed': False,
+            },
+            'ingredients': ingredients[recipe.pk],
+            'is_favorited': False,
+            'is_in_shopping_cart': False,
+            'name': recipe.name,
+            'image': recipe.image.url if recipe.image else None,
+            'image_renditions': rendition_urls(recipe),
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+    return fragments
+
+
+def absolute(request, url):
+    if request is None or not url:
+        return url
+    return request.build_absolute_uri(url)
+
+
+def overlay(fragment, recipe, request):
+    """Fill the viewer flags and absolute URLs into a cached fragment."""
+    data = dict(fragment)
+    data['author'] = dict(fragment['author'],
+                          is_subscribed=recipe.author_is_subscribed)
+    data['is_favorited'] = recipe.is_favorited
+    data['is_in_shopping_cart'] = recipe.is_in_shopping_cart
+    data['image'] = absolute(request, fragment['image'])
+    data['image_renditions'] = {
+        key: absolute(request, url)
+        for key, url in fragment['image_renditions'].items()
+    }
+    return data
+
+
+def render_recipes(recipes, request, cached=True):
+    """Serialize recipes annotated by ``with_user_flags``.
+
+    Fragments found in the cache skip the tags and ingredients queries;
+    only the misses are built, then stored for the next viewer. Bulk
+    exports pass ``cached=False`` so they do not evict hot fragments.
+    """
+    if not cached:
+        fragments = build_fragments(recipes)
+        return [overlay(fragments[recipe.pk], recipe, request)
+                for recipe in recipes]
+    versions = (get_version('tags'), get_version('ingredients'))
+    keys = {recipe.pk: fragment_key(recipe, versions) for recipe in recipes}
+    fragments = cache.get_many(list(keys.values()))
+    missing = [recipe for recipe in recipes
+               if keys[recipe.pk] not in fragments]
+    if missing:
+        fresh = {keys[recipe_id]: fragment for recipe_id, fragment
+                 in build_fragments(missing).items()}
+        cache.set_many(fresh, settings.RECIPE_FRAGMENT_TIMEOUT)
+        fragments.update(fresh)
+    return [overlay(fragments[keys[recipe.pk]], recipe, request)
+            for recipe in recipes]
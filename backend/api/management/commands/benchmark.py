@@ -0,0 +1,32 @@
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Run micro-benchmarks against the current database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*',
+                            help=f'One of: {", ".join(BENCHMARKS)}.')
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(unknown)}')
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            baseline = None
+            for label, timings in BENCHMARKS[name](options['repeat']):
+                mean = statistics.mean(timings)
+                baseline = baseline or mean
+                self.stdout.write(
+                    f'  {label:<12} mean {mean * 1000:9.3f} ms  '
+                    f'median {statistics.median(timings) * 1000:9.3f} ms  '
+                    f'max {max(timings) * 1000:9.3f} ms  '
+                    f'x{baseline / mean:.1f}'
+                )
@@ -0,0 +1,195 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from rest_framework import permissions
+from rest_framework.views import APIView
+
+from foodgram.db.pool import pool_stats
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+STAGES = ('db', 'app', 'render', 'total')
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus exposition format."""
+
+    def __init__(self, name, help_text, buckets, labels):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        position = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [
+                    [0] * (len(self.buckets) + 1), 0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def format_labels(self, label_values, **extra):
+        pairs = list(zip(self.labels, label_values)) + list(extra.items())
+        return ','.join(f'{key}="{value}"' for key, value in pairs)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}',
+                 f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {key: (list(counts), total, count)
+                      for key, (counts, total, count) in self.series.items()}
+        for label_values, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(
+                    (*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                labels = self.format_labels(label_values, le=bound)
+                lines.append(f'{self.name}_bucket{{{labels}}} {cumulative}')
+            labels = self.format_labels(label_values)
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+durations = Histogram(
+    'foodgram_request_duration_seconds',
+    'Request time by view and stage.',
+    DURATION_BUCKETS, ('view', 'stage'))
+queries = Histogram(
+    'foodgram_request_queries',
+    'SQL queries per request by view.',
+    QUERY_BUCKETS, ('view',))
+REGISTRY = [durations, queries]
+
+
+def view_name(view_func, method):
+    """``RecipeViewSet.list`` for viewsets, function name otherwise."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(method, method)}'
+
+
+class RequestTimer:
+    """Timings of one request, filled in by ``MetricsMiddleware``."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = 'unresolved'
+        self.queries = 0
+        self.db = 0
+        self.view_started = self.view_db = None
+        self.app = self.render = 0
+        self.rendered = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def view_finished(self):
+        if self.view_started is None:
+            return
+        self.app = (time.perf_counter() - self.view_started
+                    - (self.db - self.view_db))
+        self.rendered = time.perf_counter()
+
+    def render_finished(self, response):
+        self.render = time.perf_counter() - self.rendered
+
+
+class MetricsMiddleware:
+    """Per-request SQL, application, rendering and total time.
+
+    SQL is timed through ``connection.execute_wrapper``. ``app`` is view
+    time spent outside SQL, which for read actions is dominated by the
+    serializers, and ``render`` is DRF rendering of the serialized data.
+    Timings are sent back as a ``Server-Timing`` header and aggregated
+    into process-local histograms exposed by ``MetricsView``. Queries run
+    while a streaming response is consumed are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        timer = request.metrics_timer = RequestTimer()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        if timer.rendered is None:
+            timer.view_finished()
+        total = time.perf_counter() - timer.started
+        timings = {'db': timer.db, 'app': timer.app,
+                   'render': timer.render, 'total': total}
+        for stage in STAGES:
+            durations.observe(timings[stage], timer.view, stage)
+        queries.observe(timer.queries, timer.view)
+        response['Server-Timing'] = ', '.join(
+            [f'db;dur={timer.db * 1000:.2f};desc="{timer.queries} queries"']
+            + [f'{stage};dur={timings[stage] * 1000:.2f}'
+               for stage in STAGES[1:]]
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = getattr(request, 'metrics_timer', None)
+        if timer is None:
+            return
+        timer.view = view_name(view_func, request.method.lower())
+        timer.view_started = time.perf_counter()
+        timer.view_db = timer.db
+
+    def process_template_response(self, request, response):
+        timer = getattr(request, 'metrics_timer', None)
+        if timer is not None:
+            timer.view_finished()
+            response.add_post_render_callback(timer.render_finished)
+        return response
+
+
+def expose_pools():
+    """Connection pool gauges and counters of this process."""
+    stats = pool_stats()
+    lines = ['# HELP foodgram_db_pool_connections Connections by state.',
+             '# TYPE foodgram_db_pool_connections gauge']
+    for alias, pool in sorted(stats.items()):
+        for state in ('idle', 'in_use'):
+            lines.append(f'foodgram_db_pool_connections'
+                         f'{{alias="{alias}",state="{state}"}} {pool[state]}')
+    lines += ['# HELP foodgram_db_pool_events_total Pool events by kind.',
+              '# TYPE foodgram_db_pool_events_total counter']
+    for alias, pool in sorted(stats.items()):
+        for event in ('created', 'reused', 'closed', 'broken', 'waits',
+                      'timeouts'):
+            lines.append(f'foodgram_db_pool_events_total'
+                         f'{{alias="{alias}",event="{event}"}} {pool[event]}')
+    return lines
+
+
+class MetricsView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        lines = []
+        for histogram in REGISTRY:
+            lines.extend(histogram.expose())
+        lines.extend(expose_pools())
+        return HttpResponse(
+            '\n'.join(lines) + '\n',
+            content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,4 +1,13 @@
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from rest_framework import mixins, viewsets
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.response import Response
+from rest_framework.utils import encoders
 
 
 class ListViewSet(
@@ -7,3 +16,139 @@ class ListViewSet(
     viewsets.GenericViewSet
 ):
     pass
+
+
+class StreamingListMixin:
+    """Staff-only ``?stream=true``: the whole list as one JSON array.
+
+    The filtered queryset is walked with ``iterator(chunk_size=...)``
+    and each chunk is serialized and sent before the next one is read,
+    so memory stays flat however many rows are returned.
+    """
+
+    stream_query_param = 'stream'
+
+    def serialize_chunk(self, objects):
+        return self.get_serializer(objects, many=True).data
+
+    def stream(self, queryset):
+        chunk_size = settings.STREAM_CHUNK_SIZE
+        rows = queryset.iterator(chunk_size=chunk_size)
+        separator = '['
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            for item in self.serialize_chunk(chunk):
+                yield separator + json.dumps(
+                    item, cls=encoders.JSONEncoder, ensure_ascii=False,
+                    separators=(',', ':'))
+                separator = ','
+        yield '[]' if separator == '[' else ']'
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(self.stream_query_param) != 'true':
+            return super().list(request, *args, **kwargs)
+        if not request.user.is_staff:
+            raise PermissionDenied('Streaming is available to staff only.')
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(
+            (part.encode() for part in self.stream(queryset)),
+            content_type='application/json')
+
+
+class CursorPaginationMixin:
+    """Opt-in keyset pagination with ``?pagination=cursor``.
+
+    Links produced by the cursor paginator carry ``cursor=``, which
+    keeps following pages on the same paginator.
+    """
+
+    cursor_pagination_class = None
+
+    def get_cursor_pagination_class(self):
+        return self.cursor_pagination_class
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_pagination_class = self.get_cursor_pagination_class()
+            params = self.request.query_params
+            if cursor_pagination_class is not None and (
+                    params.get('pagination') == 'cursor'
+                    or 'cursor' in params):
+                self._paginator = cursor_pagination_class()
+        if hasattr(self, '_paginator'):
+            return self._paginator
+        return super().paginator
+
+
+class SnapshotListMixin:
+    """Answer unfiltered list requests from a prebuilt ``Snapshot``."""
+
+    snapshot = None
+
+    def list(self, request, *args, **kwargs):
+        content, etag = self.snapshot.get()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+class ConditionalReadMixin:
+    """list/retrieve that answer conditional requests before serializing.
+
+    Objects are loaded without their nested relations first, so a 304
+    costs only the page query. Subclasses build the ETag in
+    ``get_etag`` and override ``serialize`` to load the nested relations
+    they render. No Last-Modified is sent: a date cannot follow
+    everything an ETag covers.
+    """
+
+    def get_etag(self, objects, extra=None):
+        raise NotImplementedError
+
+    def serialize(self, objects):
+        return self.get_serializer(objects, many=True).data
+
+    def conditional_response(self, request, etag):
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            self.set_validators(response, etag)
+        return response
+
+    def set_validators(self, response, etag):
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization',))
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            objects, extra = list(queryset), None
+        else:
+            objects = page
+            extra = self.get_paginated_response([]).data
+        etag = self.get_etag(objects, extra)
+        response = self.conditional_response(request, etag)
+        if response is not None:
+            return response
+        data = self.serialize(objects)
+        if page is None:
+            response = Response(data)
+        else:
+            response = self.get_paginated_response(data)
+        self.set_validators(response, etag)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self.get_etag([instance])
+        response = self.conditional_response(request, etag)
+        if response is not None:
+            return response
+        response = Response(self.serialize([instance])[0])
+        self.set_validators(response, etag)
+        return response
@@ -1,5 +1,97 @@
+import base64
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from recipes import feed
 
 
 class Paginator(pagination.PageNumberPagination):
     page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+
+class SubscriptionCursorPaginator(pagination.CursorPagination):
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+    ordering = ('id',)
+
+
+class KeysetPaginator(pagination.CursorPagination):
+    """Forward-only keyset pagination on ``(pub_date, id)`` positions.
+
+    The cursor is the position of the last recipe on the page and the
+    next page starts strictly after it, so recipes sharing a
+    ``pub_date`` are neither skipped nor repeated, pages stay stable
+    while new recipes arrive, and no page needs an OFFSET.
+    """
+
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    def decode_position(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            pub_date, recipe_id = base64.urlsafe_b64decode(
+                encoded.encode('ascii')).decode('ascii').split('|')
+            return datetime.fromisoformat(pub_date), int(recipe_id)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def position_link(self, position):
+        pub_date, recipe_id = position
+        encoded = base64.urlsafe_b64encode(
+            f'{pub_date.isoformat()}|{recipe_id}'.encode('ascii'))
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def paginate(self, request, fetch, position):
+        """Page of ``fetch(size, after)`` items and the link to the next.
+
+        ``position`` gives the ``(pub_date, id)`` pair of an item.
+        """
+        self.base_url = request.build_absolute_uri()
+        size = self.get_page_size(request)
+        page = fetch(size + 1, self.decode_position(request))
+        self.next_link = (self.position_link(position(page[size - 1]))
+                          if len(page) > size else None)
+        return page[:size]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next_link),
+            ('previous', None),
+            ('results', data),
+        ]))
+
+
+class RecipeCursorPaginator(KeysetPaginator):
+
+    def paginate_queryset(self, queryset, request, view=None):
+        def fetch(size, after):
+            recipes = queryset.order_by('-pub_date', '-id')
+            if after is not None:
+                recipes = recipes.filter(feed.before(after, 'pub_date', 'id'))
+            return list(recipes[:size])
+
+        return self.paginate(
+            request, fetch, lambda recipe: (recipe.pub_date, recipe.pk))
+
+
+class FeedPaginator(KeysetPaginator):
+    """Pages of ``recipes.feed.timeline``."""
+
+    def paginate_feed(self, user, request):
+        """Recipe ids of the requested page of the user's feed."""
+        page = self.paginate(
+            request,
+            lambda size, after: feed.timeline(user, size, after),
+            lambda position: position)
+        return [recipe_id for _, recipe_id in page]
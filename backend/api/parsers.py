@@ -0,0 +1,28 @@
+from django.conf import settings
+from rest_framework import exceptions, status
+from rest_framework.parsers import JSONParser
+
+
+class RequestTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Request body is too large.'
+    default_code = 'request_too_large'
+
+
+class BoundedJSONParser(JSONParser):
+    """JSON parser refusing bodies over ``MAX_REQUEST_BODY_SIZE``.
+
+    DRF reads the request stream directly, so Django's
+    ``DATA_UPLOAD_MAX_MEMORY_SIZE`` does not apply to JSON bodies.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        if request is not None:
+            try:
+                length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                length = 0
+            if length > settings.MAX_REQUEST_BODY_SIZE:
+                raise RequestTooLarge()
+        return super().parse(stream, media_type, parser_context)
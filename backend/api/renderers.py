@@ -0,0 +1,149 @@
+import csv
+import os
+import tempfile
+from itertools import chain
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+
+TITLE = 'Список покупок:'
+CHUNK_SIZE = 64 * 1024
+
+
+def shopping_list_line(row):
+    return '{name} ({amount}) - {unit}'.format(
+        name=row['ingredient__name'],
+        amount=row['amount'],
+        unit=row['ingredient__measurement_unit'],
+    )
+
+
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    """Pick the shopping list format by ``?format=`` only.
+
+    Accept headers are ignored, so a client sending
+    ``Accept: application/json`` still gets a file back.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query_param = self.settings.URL_FORMAT_OVERRIDE
+        file_format = (format_suffix
+                       or request.query_params.get(format_query_param))
+        if file_format:
+            renderers = self.filter_renderers(renderers, file_format)
+        renderer = renderers[0]
+        return renderer, renderer.media_type
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Base for shopping list files.
+
+    ``stream`` turns an iterable of aggregated ingredient rows into
+    chunks of bytes for ``StreamingHttpResponse``; ``render`` is only
+    used for error payloads such as a missing token.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            lines = [f'{key}: {value}' for key, value in data.items()]
+        else:
+            lines = [str(data)]
+        return b''.join(self.stream_lines(lines))
+
+    def stream(self, rows):
+        yield from self.stream_lines(chain(
+            [TITLE], (shopping_list_line(row) for row in rows)))
+
+    def stream_lines(self, lines):
+        raise NotImplementedError
+
+    def get_filename(self):
+        return f'list_ingredients.{self.format}'
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream_lines(self, lines):
+        for line in lines:
+            yield f'{line}\n'.encode(self.charset)
+
+
+class Echo:
+    """File-like object which returns what is written to it."""
+
+    def write(self, value):
+        return value
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('name', 'amount', 'measurement_unit')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        writer = csv.writer(Echo())
+        if isinstance(data, dict):
+            rows = data.items()
+        else:
+            rows = [[data]]
+        return ''.join(
+            writer.writerow(row) for row in rows).encode(self.charset)
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header).encode(self.charset)
+        for row in rows:
+            yield writer.writerow((
+                row['ingredient__name'],
+                row['amount'],
+                row['ingredient__measurement_unit'],
+            )).encode(self.charset)
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    """PDF shopping list.
+
+    reportlab has to finish the document before it can be sent, so it
+    is written to a spooled temporary file and then streamed in chunks.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    font_size = 12
+    margin = 50
+
+    def get_font(self):
+        font_path = settings.SHOPPING_LIST_FONT
+        if not font_path or not os.path.exists(font_path):
+            return 'Helvetica'
+        name = os.path.splitext(os.path.basename(font_path))[0]
+        if name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(name, font_path))
+        return name
+
+    def stream_lines(self, lines):
+        with tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE) as file:
+            font = self.get_font()
+            _, height = A4
+            pdf = canvas.Canvas(file, pagesize=A4)
+            pdf.setFont(font, self.font_size)
+            position = height - self.margin
+            for line in lines:
+                if position < self.margin:
+                    pdf.showPage()
+                    pdf.setFont(font, self.font_size)
+                    position = height - self.margin
+                pdf.drawString(self.margin, position, line)
+                position -= self.font_size * 1.5
+            pdf.save()
+            file.seek(0)
+            yield from iter(lambda: file.read(CHUNK_SIZE), b'')
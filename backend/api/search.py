@@ -0,0 +1,70 @@
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+
+from .versions import VersionedValue
+
+NGRAM_SIZE = 3
+
+
+def ngrams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class IngredientIndex(VersionedValue):
+    """Process-local search index over ingredients.
+
+    Names are kept in a sorted array for prefix lookups and in n-gram
+    tables for substring lookups. Prefix hits go first, substring hits
+    follow, both in alphabetical order. The index is built on first use
+    and rebuilt lazily after the ``ingredients`` version is bumped.
+    """
+
+    version_name = 'ingredients'
+
+    def build(self):
+        rows = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda row: (row['name'].lower(), row['id'])
+        )
+        keys = [row['name'].lower() for row in rows]
+        grams = {}
+        for position, key in enumerate(keys):
+            for size in range(1, NGRAM_SIZE + 1):
+                for gram in ngrams(key, size):
+                    grams.setdefault(gram, set()).add(position)
+        return rows, keys, grams
+
+    def prefix_positions(self, keys, query):
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        return range(start, end)
+
+    def substring_positions(self, keys, grams, query):
+        size = min(len(query), NGRAM_SIZE)
+        candidates = None
+        for gram in ngrams(query, size):
+            positions = grams.get(gram, set())
+            candidates = (positions if candidates is None
+                          else candidates & positions)
+            if not candidates:
+                return []
+        return [position for position in sorted(candidates)
+                if query in keys[position]]
+
+    def search(self, query):
+        rows, keys, grams = self.get()
+        query = query.lower()
+        if not query:
+            return list(rows)
+        prefix = self.prefix_positions(keys, query)
+        substring = [position for position in
+                     self.substring_positions(keys, grams, query)
+                     if position not in prefix]
+        return [rows[position]
+                for position in (*prefix, *substring)]
+
+
+ingredient_index = IngredientIndex()
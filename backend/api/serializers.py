@@ -3,15 +3,20 @@ from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from .coverage import coverage_index
+from .fields import (Base64ImageField, BulkPrimaryKeyRelatedField,
+                     RenditionsField, in_bulk)
+from .signals import recipe_write
 from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
                             ShoppingCart, Subscribe, Tag)
 
 User = get_user_model()
+MAX_BULK_RECIPES = 100
 
 
 class CreateUserSerializer(UserCreateSerializer):
@@ -38,6 +43,8 @@ class CustomUserSerializer(UserSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         current_user = self.context.get('request').user
         if current_user.is_authenticated:
             return Subscribe.objects.filter(user=current_user,
@@ -88,16 +95,24 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_renditions = RenditionsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'image_renditions', 'text', 'cooking_time'
         )
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         current_user = self.context.get('request').user
         if current_user.is_authenticated:
             return Favorite.objects.filter(
@@ -107,6 +122,8 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         current_user = self.context.get('request').user
         if current_user.is_authenticated:
             return ShoppingCart.objects.filter(
@@ -142,20 +159,22 @@ class SubscribeSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        recipes = Recipe.objects.filter(author=obj.author)
+        if hasattr(obj.author, 'limited_recipes'):
+            recipes = obj.author.limited_recipes
+        else:
+            recipes = Recipe.objects.filter(author=obj.author)
+            recipes_limit = self.context.get('recipes_limit')
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return RecipeSubSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
     def get_is_subscribed(self, obj):
         current_user = self.context.get('request').user
-        if current_user.is_authenticated:
-            return Subscribe.objects.filter(
-                user=current_user,
-                author=obj.author
-            ).exists()
-        return False
+        return (current_user.is_authenticated
+                and obj.user_id == current_user.id)
 
     def validate(self, data):
         if self.context.get('author') == self.context.get('request').user:
@@ -165,9 +184,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
 
 
 class AddAmountIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -185,7 +202,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         slug_field='username',
     )
     image = Base64ImageField()
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True
     )
@@ -195,10 +212,21 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         fields = ('name', 'text', 'cooking_time', 'author',
                   'ingredients', 'tags', 'image',)
 
+    def save(self, **kwargs):
+        image = self.validated_data.get('image')
+        try:
+            return super().save(**kwargs)
+        finally:
+            # The storage moves the decoded temporary file into place.
+            if image is not None:
+                image.close()
+
     def to_representation(self, instance):
         ingredients = super().to_representation(instance)
         ingredients['ingredients'] = IngredientAmountSerializer(
-            instance.recipe_amount.all(), many=True).data
+            instance.recipe_amount.select_related(
+                'ingredient').order_by('id'),
+            many=True).data
         return ingredients
 
     def add_ingredients(self, ingredients, tags, model):
@@ -208,23 +236,70 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         ) for part in ingredients]
         IngredientAmount.objects.bulk_create(recipe_ingredient)
 
+    def index_ingredients(self, recipe, ingredients):
+        ingredient_ids = [part['id'].pk for part in ingredients]
+        transaction.on_commit(lambda: coverage_index.update_recipe(
+            recipe.pk, ingredient_ids))
+
+    def update_ingredients(self, recipe, ingredients):
+        """Write only the ingredient rows that differ from ``ingredients``.
+
+        New ingredients are inserted, changed amounts go through one
+        ``bulk_update`` and dropped ingredients are deleted; rows that
+        did not change are left alone.
+        """
+        submitted = {part['id'].pk: part['amount'] for part in ingredients}
+        existing = {row.ingredient_id: row for row in
+                    IngredientAmount.objects.filter(recipe=recipe)}
+        stale = [row.pk for ingredient_id, row in existing.items()
+                 if ingredient_id not in submitted]
+        if stale:
+            IngredientAmount.objects.filter(pk__in=stale).delete()
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = submitted.get(ingredient_id, row.amount)
+            if row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ('amount',))
+        created = [
+            IngredientAmount(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in submitted.items()
+            if ingredient_id not in existing
+        ]
+        if created:
+            IngredientAmount.objects.bulk_create(created)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        self.add_ingredients(ingredients, tags, instance)
+        # Saving the recipe below updates ``updated_at`` once and the
+        # coverage index is updated once for the whole recipe.
+        with recipe_write(instance.pk):
+            instance.tags.set(tags)
+            self.update_ingredients(instance, ingredients)
+        self.index_ingredients(instance, ingredients)
         return super().update(instance, validated_data)
 
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = super().create(validated_data)
-        self.add_ingredients(ingredients, tags, recipe)
+        with recipe_write(recipe.pk):
+            self.add_ingredients(ingredients, tags, recipe)
+        self.index_ingredients(recipe, ingredients)
         return recipe
 
     def validate_ingredients(self, value):
         if not value:
             raise ValidationError('You need to choose the ingredients.')
+        resolved = in_bulk(Ingredient.objects.all(),
+                           [item['id'] for item in value])
+        for item, ingredient in zip(value, resolved):
+            item['id'] = ingredient
         ingredients = {}
         for item in value:
             if item['id'] in ingredients:
@@ -257,10 +332,11 @@ class FavoriteSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(
         source='recipe.image',
         read_only=True)
+    image_renditions = RenditionsField(source='recipe')
 
     class Meta:
         model = Favorite
-        fields = ('id', 'name', 'image', 'coocking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'coocking_time')
 
 
 class CartSerializer(serializers.ModelSerializer):
@@ -276,7 +352,16 @@ class CartSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(
         source='recipe.image',
         read_only=True)
+    image_renditions = RenditionsField(source='recipe')
 
     class Meta:
         model = ShoppingCart
-        fields = ('id', 'name', 'image', 'coocking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'coocking_time')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES,
+    )
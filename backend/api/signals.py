@@ -0,0 +1,102 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from recipes import renditions
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+
+from .coverage import coverage_index
+from .versions import bump_version
+
+writing = threading.local()
+
+
+@contextmanager
+def recipe_write(recipe_id):
+    """Mark a recipe as written as a whole by the caller.
+
+    Changes to tags and ingredient amounts otherwise touch their recipe
+    and patch the coverage index one row at a time. A write that saves
+    and reindexes the recipe itself afterwards, or deletes it, does
+    both once instead.
+    """
+    ids = getattr(writing, 'ids', frozenset())
+    writing.ids = ids | {recipe_id}
+    try:
+        yield
+    finally:
+        writing.ids = ids
+
+
+def row_change(recipe_id):
+    """Whether a row change of the recipe is handled row by row."""
+    return recipe_id not in getattr(writing, 'ids', ())
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    # After commit, so that no process rebuilds from the old rows and
+    # stores them under the new version.
+    transaction.on_commit(lambda: bump_version('ingredients'))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('tags'))
+
+
+@receiver(post_save, sender=IngredientAmount)
+def ingredient_amount_saved(sender, instance, created, **kwargs):
+    if not row_change(instance.recipe_id):
+        return
+    if created:
+        transaction.on_commit(lambda: coverage_index.add(
+            instance.recipe_id, instance.ingredient_id))
+    else:
+        # The ingredient of the row may have changed.
+        transaction.on_commit(lambda: bump_version('recipe_ingredients'))
+    Recipe.touch(pk=instance.recipe_id)
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def ingredient_amount_deleted(sender, instance, **kwargs):
+    if not row_change(instance.recipe_id):
+        return
+    transaction.on_commit(lambda: coverage_index.discard(
+        instance.recipe_id, instance.ingredient_id))
+    Recipe.touch(pk=instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_') and row_change(instance.pk):
+            Recipe.touch(pk=instance.pk)
+    elif action == 'pre_clear':
+        Recipe.touch(tags=instance)
+    elif action in ('post_add', 'post_remove'):
+        Recipe.touch(pk__in=pk_set)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    # Ingredient amounts are deleted first, each sending post_delete.
+    writing.ids = getattr(writing, 'ids', frozenset()) | {instance.pk}
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_id = instance.pk
+    writing.ids = getattr(writing, 'ids', frozenset()) - {recipe_id}
+    transaction.on_commit(
+        lambda: coverage_index.update_recipe(recipe_id, ()))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    if renditions.needs_renditions(instance):
+        renditions.schedule(instance)
@@ -0,0 +1,28 @@
+import hashlib
+
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Ingredient, Tag
+
+from .serializers import IngredientSerializer, TagSerializer
+from .versions import VersionedValue
+
+
+class Snapshot(VersionedValue):
+    """Rendered JSON of a whole reference table with its strong ETag."""
+
+    def __init__(self, version_name, queryset, serializer_class):
+        super().__init__()
+        self.version_name = version_name
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+
+    def build(self):
+        data = self.serializer_class(self.queryset.all(), many=True).data
+        content = JSONRenderer().render(data)
+        return content, f'"{hashlib.sha1(content).hexdigest()}"'
+
+
+tags_snapshot = Snapshot('tags', Tag.objects.all(), TagSerializer)
+ingredients_snapshot = Snapshot(
+    'ingredients', Ingredient.objects.all(), IngredientSerializer)
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+KEY = 'version:{}'
+
+
+def new_version():
+    # Start from the clock rather than from 1, so that a flushed cache
+    # never hands out a version some process has already seen.
+    return time.time_ns()
+
+
+def get_version(name):
+    """Return the current version of a named data set.
+
+    Versions live in the default cache, so with a shared backend
+    every worker process notices changes made by the others.
+    """
+    version = cache.get(KEY.format(name))
+    if version is None:
+        cache.add(KEY.format(name), new_version(), timeout=None)
+        return cache.get(KEY.format(name))
+    return version
+
+
+def bump_version(name):
+    try:
+        return cache.incr(KEY.format(name))
+    except ValueError:
+        version = new_version()
+        cache.set(KEY.format(name), version, timeout=None)
+        return version
+
+
+def bump_after_bulk_load(name):
+    """Bump ``name`` after rows were written with ``bulk_create``.
+
+    ``bulk_create`` sends no ``post_save``, so the signal handlers that
+    usually bump the version never run. Inside a transaction the bump
+    waits for the commit, like theirs.
+    """
+    transaction.on_commit(lambda: bump_version(name))
+
+
+class VersionedValue:
+    """Process-local value rebuilt whenever its named version changes."""
+
+    version_name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def get(self):
+        version = get_version(self.version_name)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._value = self.build()
+                    self._version = version
+        return self._value
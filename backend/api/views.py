@@ -1,40 +1,83 @@
+import hashlib
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Sum
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import permissions, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from .filters import IngredientFilter, RecipeFilter
-from .mixins import ListViewSet
-from .paginations import Paginator
+from .filters import RANKED_FILTERS, RecipeFilter
+from .fragments import render_recipes
+from .mixins import (ConditionalReadMixin, CursorPaginationMixin, ListViewSet,
+                     SnapshotListMixin, StreamingListMixin)
+from .paginations import (FeedPaginator, Paginator, RecipeCursorPaginator,
+                          SubscriptionCursorPaginator)
 from .permissions import IsAdminUserOrReadOnly, IsOwnerAdminOrReadOnly
+from .renderers import (CSVShoppingListRenderer, PDFShoppingListRenderer,
+                        ShoppingListNegotiation, TextShoppingListRenderer)
+from .search import ingredient_index
 from .serializers import (CartSerializer, FavoriteSerializer,
-                          IngredientSerializer, RecipeReadOnlySerializer,
-                          RecipeWriteSerializer, SubscribeSerializer,
-                          TagSerializer)
+                          IngredientSerializer, RecipeIdsSerializer,
+                          RecipeReadOnlySerializer, RecipeWriteSerializer,
+                          SubscribeSerializer, TagSerializer)
+from .snapshots import ingredients_snapshot, tags_snapshot
+from .versions import get_version
+from recipes import feed as timelines
+from recipes.counters import change_counter
 from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
                             ShoppingCart, Subscribe, Tag)
 
 User = get_user_model()
 
 
-class UserUsualViewSet(UserViewSet):
+class UserUsualViewSet(CursorPaginationMixin, StreamingListMixin,
+                       UserViewSet):
     permission_classes = (IsAdminUserOrReadOnly,)
     pagination_class = Paginator
 
+    def get_cursor_pagination_class(self):
+        if self.action == 'subscriptions':
+            return SubscriptionCursorPaginator
+        return None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.action == 'list' and user.is_authenticated:
+            return queryset.annotate(is_subscribed=Exists(
+                Subscribe.objects.filter(user=user, author=OuterRef('pk'))))
+        return queryset
+
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            raise ValidationError(
+                {'recipes_limit': 'A valid integer is required.'})
+        if recipes_limit < 0:
+            raise ValidationError(
+                {'recipes_limit': 'Must be greater than or equal to zero.'})
+        return recipes_limit
+
     @action(
         detail=False,
         methods=('get',),
         permission_classes=(permissions.IsAuthenticated,),
     )
     def subscriptions(self, request):
-        subscriptions = Subscribe.objects.filter(user=self.request.user)
+        subscriptions = Subscribe.objects.filter(
+            user=self.request.user
+        ).with_recipes(self.get_recipes_limit()).order_by('id')
         pages = self.paginate_queryset(subscriptions)
         serializer = SubscribeSerializer(
             pages,
@@ -43,42 +86,118 @@ class UserUsualViewSet(UserViewSet):
         )
         return self.get_paginated_response(serializer.data)
 
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def feed(self, request):
+        paginator = FeedPaginator()
+        recipe_ids = paginator.paginate_feed(request.user, request)
+        recipes = Recipe.objects.filter(id__in=recipe_ids).select_related(
+            'author').with_user_flags(request.user).in_bulk()
+        return paginator.get_paginated_response(render_recipes(
+            [recipes[recipe_id] for recipe_id in recipe_ids
+             if recipe_id in recipes],
+            request))
+
     @action(
         detail=True,
         methods=('post', 'delete'),
         permission_classes=(permissions.IsAuthenticated,)
     )
     def subscribe(self, request, *args, **kwargs):
-        author = get_object_or_404(User, id=self.kwargs.get('id'))
         current_user = self.request.user
         if request.method == 'POST':
+            author = get_object_or_404(User, id=self.kwargs.get('id'))
             serializer = SubscribeSerializer(
+                Subscribe(author=author, user=current_user),
                 data=request.data,
-                context={'request': request, 'author': author})
+                context={'request': request, 'author': author,
+                         'recipes_limit': self.get_recipes_limit()})
             serializer.is_valid(raise_exception=True)
-            serializer.save(author=author, user=current_user)
+            if not Subscribe.objects.insert_ignore(
+                    author=author, user=current_user):
+                return Response({'errors': 'Already subscribed.'},
+                                status=HTTPStatus.BAD_REQUEST)
+            change_counter(User, 'followers_count', 1, pk=author.pk)
+            timelines.backfill(current_user, author)
             return Response(serializer.data, status=HTTPStatus.CREATED)
         elif request.method == 'DELETE':
-            Subscribe.objects.get(author=author, user=current_user).delete()
+            deleted, _ = Subscribe.objects.filter(
+                author_id=self.kwargs.get('id'), user=current_user).delete()
+            if not deleted:
+                return Response({'errors': 'Not subscribed.'},
+                                status=HTTPStatus.BAD_REQUEST)
+            change_counter(User, 'followers_count', -deleted,
+                           pk=self.kwargs.get('id'))
+            timelines.trim(current_user, self.kwargs.get('id'))
             return Response(status=HTTPStatus.NO_CONTENT)
         return Response(status=HTTPStatus.NOT_FOUND)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CursorPaginationMixin, StreamingListMixin,
+                    ConditionalReadMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     pagination_class = Paginator
+    cursor_pagination_class = RecipeCursorPaginator
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,
                           IsOwnerAdminOrReadOnly)
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
 
+    def get_cursor_pagination_class(self):
+        # Cursors follow publication order, which would drop the ranking.
+        params = self.request.query_params
+        if any(params.get(name, '').strip() for name in RANKED_FILTERS):
+            return None
+        return super().get_cursor_pagination_class()
+
+    def get_queryset(self):
+        if self.action in ('retrieve', 'list'):
+            return Recipe.objects.select_related('author').with_user_flags(
+                self.request.user)
+        return Recipe.objects.all()
+
+    def get_etag(self, objects, extra=None):
+        signature = [
+            self.request.user.pk,
+            get_version('tags'),
+            get_version('ingredients'),
+            extra,
+        ]
+        for recipe in objects:
+            author = recipe.author
+            signature.append((
+                recipe.pk, recipe.updated_at.isoformat(),
+                recipe.is_favorited, recipe.is_in_shopping_cart,
+                recipe.author_is_subscribed, author.email, author.username,
+                author.first_name, author.last_name,
+            ))
+        digest = hashlib.sha1(repr(signature).encode()).hexdigest()
+        return f'"{digest}"'
+
+    def serialize(self, objects):
+        return render_recipes(objects, self.request)
+
+    def serialize_chunk(self, objects):
+        return render_recipes(objects, self.request, cached=False)
+
     def get_serializer_class(self):
         if self.action in ('retrieve', 'list'):
             return RecipeReadOnlySerializer
         return RecipeWriteSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        change_counter(User, 'recipes_count', 1, pk=self.request.user.pk)
+        timelines.fan_out(recipe)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        change_counter(User, 'recipes_count', -1, pk=instance.author_id)
 
     @action(
         detail=True,
@@ -86,39 +205,40 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def favorite(self, request, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
-        current_user = self.request.user
-        if request.method == 'POST':
-            serializer = FavoriteSerializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save(user=current_user, recipe=recipe)
-            return Response(serializer.data, status=HTTPStatus.CREATED)
-        elif request.method == 'DELETE':
-            Favorite.objects.get(user=current_user, recipe=recipe).delete()
-            return Response(status=HTTPStatus.NO_CONTENT)
-        return Response(status=HTTPStatus.NOT_FOUND)
+        return self.link(request, Favorite, 'user', FavoriteSerializer,
+                         'favorites_count')
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path='favorite',
+    )
+    def favorite_many(self, request):
+        return self.link_many(request, Favorite, 'user', 'favorites_count')
 
     @action(
         detail=False,
         methods=('get',),
-        permission_classes=(permissions.IsAuthenticated,)
+        permission_classes=(permissions.IsAuthenticated,),
+        renderer_classes=(TextShoppingListRenderer,
+                          CSVShoppingListRenderer,
+                          PDFShoppingListRenderer),
+        content_negotiation_class=ShoppingListNegotiation,
     )
     def download_shopping_cart(self, request):
-        filename = 'list_ingredients.txt'
-        instance = request.user.cart.all()
+        renderer = request.accepted_renderer
         ingredients = IngredientAmount.objects.filter(
-            recipe__in=instance.values('recipe')
-        ).values('ingredient').annotate(amount=Sum('amount'))
-        list_ingredients = 'Список покупок:\n'
-        for ingredient in ingredients:
-            amount = ingredient['amount']
-            ingredient = Ingredient.objects.get(id=ingredient['ingredient'])
-            measurement_unit = ingredient.measurement_unit
-            list_ingredients += (
-                f'{ingredient} ({amount}) - {measurement_unit}\n'
-            )
-        response = HttpResponse(list_ingredients, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={filename}'
+            recipe__in=request.user.cart.values('recipe')
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit'
+        ).annotate(amount=Sum('amount')).order_by('ingredient__name')
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients.iterator()),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename={renderer.get_filename()}')
         return response
 
     @action(
@@ -127,31 +247,100 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def shopping_cart(self, request, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
-        current_user = self.request.user
+        return self.link(request, ShoppingCart, 'author', CartSerializer,
+                         'cart_count')
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path='shopping_cart',
+    )
+    def shopping_cart_many(self, request):
+        return self.link_many(request, ShoppingCart, 'author', 'cart_count')
+
+    def link(self, request, model, user_field, serializer_class, counter):
+        """Add the recipe to, or remove it from, a list of the user.
+
+        POST inserts with conflicts ignored and DELETE is one conditional
+        delete; the affected row count tells whether the recipe was
+        already in, or missing from, the list.
+        """
+        recipe_id = self.kwargs.get('pk')
+        lookups = {user_field: request.user}
+        name = model._meta.verbose_name.lower()
         if request.method == 'POST':
-            serializer = CartSerializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save(author=current_user, recipe=recipe)
-            return Response(serializer.data, status=HTTPStatus.CREATED)
-        elif request.method == 'DELETE':
-            ShoppingCart.objects.filter(author=current_user,
-                                        recipe=recipe).delete()
-            return Response(status=HTTPStatus.NO_CONTENT)
-        return Response(status=HTTPStatus.NOT_FOUND)
+            recipe = get_object_or_404(Recipe, id=recipe_id)
+            if not model.objects.insert_ignore(recipe=recipe, **lookups):
+                return Response(
+                    {'errors': f'Recipe is already in {name}.'},
+                    status=HTTPStatus.BAD_REQUEST)
+            change_counter(Recipe, counter, 1, pk=recipe.pk)
+            return Response(serializer_class(model(recipe=recipe)).data,
+                            status=HTTPStatus.CREATED)
+        deleted, _ = model.objects.filter(
+            recipe_id=recipe_id, **lookups).delete()
+        if not deleted:
+            return Response({'errors': f'Recipe is not in {name}.'},
+                            status=HTTPStatus.BAD_REQUEST)
+        change_counter(Recipe, counter, -deleted, pk=recipe_id)
+        return Response(status=HTTPStatus.NO_CONTENT)
+
+    @transaction.atomic
+    def link_many(self, request, model, user_field, counter):
+        """Add several recipes to, or remove them from, a list at once.
+
+        One query checks every id and whether it is already in the list,
+        one ``bulk_create`` or ``delete`` writes the difference. Only the
+        ids that actually changed are returned.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        lookups = {user_field: request.user}
+        linked = dict(Recipe.objects.filter(id__in=recipe_ids).annotate(
+            linked=Exists(model.objects.filter(
+                recipe=OuterRef('pk'), **lookups))
+        ).order_by().values_list('id', 'linked'))
+        missing = sorted(set(recipe_ids) - set(linked))
+        if missing:
+            raise ValidationError({'recipes': [
+                'Objects do not exist: {}.'.format(
+                    ', '.join(map(str, missing)))]})
+        if request.method == 'POST':
+            changed = sorted(
+                recipe_id for recipe_id, is_linked in linked.items()
+                if not is_linked)
+            model.objects.bulk_create(
+                [model(recipe_id=recipe_id, **lookups)
+                 for recipe_id in changed],
+                ignore_conflicts=True)
+            change_counter(Recipe, counter, 1, pk__in=changed)
+            return Response({'added': changed})
+        changed = sorted(
+            recipe_id for recipe_id, is_linked in linked.items() if is_linked)
+        model.objects.filter(recipe_id__in=changed, **lookups).delete()
+        change_counter(Recipe, counter, -1, pk__in=changed)
+        return Response({'removed': changed})
 
 
-class TagViewSet(ListViewSet):
+class TagViewSet(SnapshotListMixin, ListViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminUserOrReadOnly,)
     pagination_class = None
+    snapshot = tags_snapshot
 
 
-class IngredientViewSet(ListViewSet):
+class IngredientViewSet(SnapshotListMixin, ListViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminUserOrReadOnly,)
     pagination_class = None
-    filter_backends = (IngredientFilter,)
-    search_fields = ('^name',)
+    snapshot = ingredients_snapshot
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        return Response(ingredient_index.search(name))
@@ -0,0 +1,37 @@
+class HealthCheckedDatabaseWrapperMixin:
+    """Check a kept connection before its first query in a request.
+
+    A backport of ``CONN_HEALTH_CHECKS`` from Django 4.1, enabled by
+    ``HEALTH_CHECKS`` in the database settings. Django 3.2 only checks
+    ``is_usable`` after an error, so a persistent connection cut by the
+    server or a proxy while idle fails the first query of the next
+    request. Requests that do not query the database pay nothing.
+    """
+
+    health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('HEALTH_CHECKS', False)
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        # Runs at the start and end of each request.
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def close_if_health_check_failed(self):
+        if (self.connection is None or not self.health_check_enabled
+                or self.health_check_done or self.in_atomic_block):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        # Not in ensure_connection: get_autocommit uses it between requests.
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
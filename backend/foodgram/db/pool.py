@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """Process-local pool of DB-API connections shared by threads.
+
+    At most ``max_size`` connections are open at once. Idle connections
+    older than ``idle_timeout`` seconds are closed, every reused one is
+    checked with ``ping`` before it is handed out, and ``acquire`` gives
+    up after ``wait_timeout`` seconds when all of them are busy.
+    """
+
+    def __init__(self, connect, ping, max_size, idle_timeout, wait_timeout):
+        self.connect = connect
+        self.ping = ping
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.idle = deque()
+        self.size = 0
+        self.condition = threading.Condition()
+        self.stats = dict.fromkeys(
+            ('created', 'reused', 'closed', 'broken', 'waits', 'timeouts'),
+            0)
+
+    def close_expired(self):
+        expired = time.monotonic() - self.idle_timeout
+        while self.idle and self.idle[0][1] < expired:
+            self.discard(self.idle.popleft()[0], 'closed')
+
+    def discard(self, connection, reason):
+        self.size -= 1
+        self.stats[reason] += 1
+        self.condition.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self.condition:
+            while True:
+                self.close_expired()
+                if self.idle:
+                    connection, _ = self.idle.pop()
+                    if self.ping(connection):
+                        self.stats['reused'] += 1
+                        return connection
+                    self.discard(connection, 'broken')
+                    continue
+                if self.size < self.max_size:
+                    self.size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No free connection in {self.wait_timeout} s '
+                        f'({self.max_size} in use).')
+                self.stats['waits'] += 1
+                self.condition.wait(remaining)
+        try:
+            connection = self.connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.stats['created'] += 1
+        return connection
+
+    def release(self, connection, broken=False):
+        with self.condition:
+            if broken:
+                self.discard(connection, 'broken')
+                return
+            # Most recently used last: reused first, oldest expire first.
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def get_stats(self):
+        with self.condition:
+            return dict(self.stats, size=self.size, idle=len(self.idle),
+                        in_use=self.size - len(self.idle),
+                        max_size=self.max_size)
+
+
+def get_pool(alias, connect, ping, options):
+    with POOLS_LOCK:
+        if alias not in POOLS:
+            POOLS[alias] = ConnectionPool(
+                connect, ping,
+                max_size=options.get('MAX_SIZE', 10),
+                idle_timeout=options.get('IDLE_TIMEOUT', 300),
+                wait_timeout=options.get('WAIT_TIMEOUT', 5),
+            )
+        return POOLS[alias]
+
+
+def pool_stats():
+    """Statistics of every pool created in this process, by alias."""
+    with POOLS_LOCK:
+        pools = dict(POOLS)
+    return {alias: pool.get_stats() for alias, pool in pools.items()}
+
+
+class PooledDatabaseWrapperMixin:
+    """Take connections from a ``ConnectionPool`` instead of opening them.
+
+    Closing the Django connection returns the DB-API connection to the
+    pool. Connections closed with an open transaction or after a
+    database error are dropped instead. Pool settings are read from the
+    ``POOL`` dictionary of the database settings; without a positive
+    ``MAX_SIZE`` the backend connects and closes as usual.
+    """
+
+    @property
+    def pooled(self):
+        return bool(self.settings_dict.get('POOL', {}).get('MAX_SIZE'))
+
+    def get_pool(self):
+        return get_pool(
+            self.alias,
+            lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(
+                self.get_connection_params()),
+            self.ping,
+            self.settings_dict.get('POOL', {}),
+        )
+
+    def ping(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        if not self.pooled:
+            return super().get_new_connection(conn_params)
+        return self.get_pool().acquire()
+
+    def _close(self):
+        if not self.pooled:
+            return super()._close()
+        if self.connection is None:
+            return None
+        broken = self.errors_occurred or self.in_atomic_block
+        if not broken and not self.get_autocommit():
+            with self.wrap_database_errors:
+                self.connection.rollback()
+        return self.get_pool().release(self.connection, broken=broken)
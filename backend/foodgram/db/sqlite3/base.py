@@ -0,0 +1,10 @@
+from django.db.backends.sqlite3 import base
+
+from ..health import HealthCheckedDatabaseWrapperMixin
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin,
+                      HealthCheckedDatabaseWrapperMixin,
+                      base.DatabaseWrapper):
+    pass
@@ -38,6 +38,7 @@ EXTERNAL_APPS = [
 INSTALLED_APPS = DEFAULT_APPS + LOCAL_APPS + EXTERNAL_APPS
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,11 +54,20 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.BoundedJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS':
         'api.paginations.Paginator',
     'PAGE_SIZE': 6,
 }
 
+# Largest ?limit= a client may ask for; staff can stream whole lists.
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', default=100))
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', default=500))
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -93,7 +103,43 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='localhost'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # Seconds a connection is kept between requests, 0 to close it.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        # Check a kept connection before its first query in a request.
+        'HEALTH_CHECKS': os.getenv('DB_HEALTH_CHECKS', default='True') == 'True',
+        'POOL': {
+            'MAX_SIZE': int(os.getenv('DB_POOL_SIZE', default=0)),
+            'IDLE_TIMEOUT': int(os.getenv('DB_POOL_IDLE_TIMEOUT', default=300)),
+            'WAIT_TIMEOUT': float(os.getenv('DB_POOL_WAIT_TIMEOUT', default=5)),
+        },
+    }
+}
+
+# Stock backends extended with health checks and the connection pool.
+DB_BACKENDS = {
+    'django.db.backends.postgresql': 'foodgram.db.postgresql',
+    'django.db.backends.sqlite3': 'foodgram.db.sqlite3',
+}
+DATABASES['default']['ENGINE'] = DB_BACKENDS.get(
+    DATABASES['default']['ENGINE'], DATABASES['default']['ENGINE'])
+
+# A pool shared by the threads of a worker: connections are returned to
+# it at the end of each request instead of being kept per thread.
+if DATABASES['default']['POOL']['MAX_SIZE']:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Data set versions, snapshots and recipe fragments live in the default
+# cache. It must be shared by every worker and by management commands,
+# otherwise a change made by one process is not seen by the others; the
+# local memory cache is only good for a single process.
+CACHE_LOCATION = os.getenv('CACHE_LOCATION')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_LOCATION,
+    } if CACHE_LOCATION else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -159,3 +205,34 @@ LOGGING = {
 }
 
 AUTH_USER_MODEL = 'users.User'
+
+MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', default=10 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', default=25_000_000))
+# base64 body of the largest allowed image plus the rest of the recipe
+MAX_REQUEST_BODY_SIZE = MAX_IMAGE_SIZE * 4 // 3 + 1024 * 1024
+
+IMAGE_RENDITIONS = {
+    'small': {'size': (320, 320), 'format': 'JPEG'},
+    'medium': {'size': (800, 800), 'format': 'JPEG'},
+    'webp': {'size': (800, 800), 'format': 'WEBP'},
+}
+IMAGE_RENDITIONS_ASYNC = os.getenv(
+    'IMAGE_RENDITIONS_ASYNC', default='True') == 'True'
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', default=2))
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='True') == 'True'
+
+# Viewer-independent recipe representations live in the default cache.
+RECIPE_FRAGMENT_TIMEOUT = int(
+    os.getenv('RECIPE_FRAGMENT_TIMEOUT', default=60 * 60))
+
+# Authors with more followers are not copied into timelines on publish;
+# their recipes are merged into the feed when it is read.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=1000))
+# Recipes of an author copied into the feed of a new subscriber.
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', default=100))
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
@@ -33,7 +33,8 @@ class IngredientAmountAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'author', 'name', 'pub_date',)
+    list_display = ('id', 'author', 'name', 'pub_date',
+                    'favorites_count', 'cart_count')
     search_fields = ('name',)
     list_filter = ('pub_date', 'author', 'name', 'tags')
     empty_value_display = '-пусто-'
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Recipe, ShoppingCart, Subscribe
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribe, 'author'),
+)
+
+
+def change_counter(model, field, delta, **lookups):
+    """Shift a denormalized counter in place with an ``F()`` expression."""
+    if not delta:
+        return 0
+    return model.objects.filter(**lookups).update(**{field: F(field) + delta})
+
+
+def actual_count(source, relation):
+    return Coalesce(Subquery(
+        source.objects.filter(
+            **{relation: OuterRef('pk')}
+        ).order_by().values(relation).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def recount(model, field, source, relation):
+    """Recompute one counter from scratch, return how many rows drifted."""
+    drifted = model.objects.annotate(
+        actual=actual_count(source, relation)
+    ).exclude(**{field: F('actual')}).values('pk')
+    return model.objects.filter(pk__in=drifted).update(
+        **{field: actual_count(source, relation)})
@@ -0,0 +1,88 @@
+import heapq
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import FeedEntry, Recipe, Subscribe
+
+BATCH_SIZE = 1000
+
+
+def is_broadcast(author):
+    """Authors whose recipes are read on demand instead of copied."""
+    return author.followers_count > settings.FEED_FANOUT_LIMIT
+
+
+def fan_out(recipe):
+    """Copy a new recipe into the timelines of the author's followers."""
+    if is_broadcast(recipe.author):
+        return 0
+    followers = Subscribe.objects.filter(
+        author_id=recipe.author_id).values_list('user_id', flat=True)
+    return len(FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, recipe=recipe,
+                   author_id=recipe.author_id, pub_date=recipe.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    ))
+
+
+def backfill(user, author):
+    """Copy the latest recipes of ``author`` into a new follower's feed."""
+    if is_broadcast(author):
+        return 0
+    recipes = Recipe.objects.filter(author=author).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+    return len(FeedEntry.objects.bulk_create(
+        [FeedEntry(user=user, recipe_id=recipe_id, author=author,
+                   pub_date=pub_date)
+         for recipe_id, pub_date in recipes],
+        ignore_conflicts=True,
+    ))
+
+
+def trim(user, author_id):
+    """Drop the recipes of an author the user no longer follows."""
+    deleted, _ = FeedEntry.objects.filter(
+        user=user, author_id=author_id).delete()
+    return deleted
+
+
+def before(position, date_field, id_field):
+    pub_date, recipe_id = position
+    return (Q(**{f'{date_field}__lt': pub_date})
+            | Q(**{date_field: pub_date, f'{id_field}__lt': recipe_id}))
+
+
+def timeline(user, size, after=None):
+    """The newest ``(pub_date, recipe_id)`` pairs of the user's feed.
+
+    Timeline rows are merged with the recipes of followed broadcast
+    authors, both read newest first starting after the ``after``
+    position, so a page costs two index range scans whatever the
+    number of subscriptions.
+    """
+    entries = FeedEntry.objects.filter(user=user)
+    pulled = Recipe.objects.filter(author__in=Subscribe.objects.filter(
+        user=user,
+        author__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).values('author'))
+    if after is not None:
+        entries = entries.filter(before(after, 'pub_date', 'recipe_id'))
+        pulled = pulled.filter(before(after, 'pub_date', 'id'))
+    entries = entries.order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id')[:size]
+    pulled = pulled.order_by('-pub_date', '-id').values_list(
+        'pub_date', 'id')[:size]
+    page = []
+    for position in heapq.merge(entries, pulled, reverse=True):
+        # A recipe copied before its author became a broadcast author
+        # comes from both sources.
+        if page and page[-1] == position:
+            continue
+        page.append(position)
+        if len(page) == size:
+            break
+    return page
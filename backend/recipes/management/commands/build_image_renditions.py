@@ -0,0 +1,46 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes import renditions
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+
+def build(recipe_id, name):
+    try:
+        return renditions.build(recipe_id, name)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Build resized and WebP copies of recipe images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild renditions that are already up to date.')
+
+    def handle(self, **options):
+        started = time.perf_counter()
+        recipes = [
+            recipe for recipe in Recipe.objects.exclude(image='').only(
+                'id', 'image', 'image_renditions').iterator()
+            if options['force'] or renditions.needs_renditions(recipe)
+        ]
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            results = list(pool.map(
+                build,
+                [recipe.pk for recipe in recipes],
+                [recipe.image.name for recipe in recipes],
+            ))
+        failed = results.count(None)
+        logger.info(
+            f'Обработано изображений: {len(results) - failed}, '
+            f'ошибок: {failed}, {time.perf_counter() - started:.1f} с')
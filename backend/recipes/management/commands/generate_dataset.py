@@ -0,0 +1,188 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.versions import bump_after_bulk_load
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Subscribe, Tag)
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+IMAGE = 'images/4eceea89-2d7a-4d93-bdb2-8e6da79fffa1.png'
+PASSWORD = 'Qwerty123'
+WORDS = ('суп', 'салат', 'пирог', 'омлет', 'рагу', 'каша', 'паста',
+         'запеканка', 'котлеты', 'блины', 'плов', 'борщ', 'соус')
+
+
+def power_law(rng, size, exponent):
+    """Index in ``range(size)`` where low indexes are much more likely."""
+    return int(size * rng.random() ** exponent)
+
+
+@contextmanager
+def explicit_pub_date(model):
+    # bulk_create would stamp every row with the same auto_now_add time,
+    # which is useless for testing ordering and keyset pagination.
+    field = model._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic dataset for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument('--subscriptions', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=365,
+                            help='Spread recipes over this many days.')
+        parser.add_argument('--image', default=IMAGE)
+
+    def handle(self, **options):
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        tags = list(Tag.objects.values_list('id', flat=True))
+        if not ingredients or not tags:
+            raise CommandError(
+                'Load ingredients and tags first: '
+                'load_ingredients, load_tags.')
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.options = options
+        started = time.perf_counter()
+        users = self.stage('users', self.create_users, options['users'])
+        recipes = self.stage(
+            'recipes', self.create_recipes,
+            options['recipes'], users, tags, ingredients)
+        self.stage('favorites', self.create_pairs, Favorite, 'user',
+                   options['favorites'], users, recipes)
+        self.stage('carts', self.create_pairs, ShoppingCart, 'author',
+                   options['carts'], users, recipes)
+        self.stage('subscriptions', self.create_subscriptions,
+                   options['subscriptions'], users)
+        call_command('recount_counters')
+        call_command('rebuild_feeds')
+        bump_after_bulk_load('recipe_ingredients')
+        logger.info(f'Готово за {time.perf_counter() - started:.1f} с')
+
+    def stage(self, name, method, *args):
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                return method(*args)
+        finally:
+            logger.info(f'{name}: {time.perf_counter() - started:.1f} с')
+
+    def bulk_create(self, model, objects):
+        chunk = []
+        for obj in objects:
+            chunk.append(obj)
+            if len(chunk) >= self.chunk_size:
+                model.objects.bulk_create(chunk, ignore_conflicts=True)
+                chunk = []
+        if chunk:
+            model.objects.bulk_create(chunk, ignore_conflicts=True)
+
+    def new_ids(self, model, last_id, objects):
+        """Insert ``objects`` and return ids of the rows created."""
+        self.bulk_create(model, objects)
+        return list(model.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True))
+
+    def last_id(self, model):
+        return model.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+
+    def create_users(self, count):
+        last_id = self.last_id(User)
+        password = make_password(PASSWORD)
+        return self.new_ids(User, last_id, (
+            User(
+                username=f'load_{last_id + number}',
+                email=f'load_{last_id + number}@example.com',
+                first_name='Load',
+                last_name=f'User {number}',
+                password=password,
+            ) for number in range(count)
+        ))
+
+    def create_recipes(self, count, users, tags, ingredients):
+        last_id = self.last_id(Recipe)
+        rng = self.rng
+        now = timezone.now()
+        seconds = self.options['days'] * 24 * 60 * 60
+        with explicit_pub_date(Recipe):
+            recipes = self.new_ids(Recipe, last_id, (
+                Recipe(
+                    author_id=users[power_law(rng, len(users), 2)],
+                    name=f'{rng.choice(WORDS)} {last_id + number}',
+                    text='Описание рецепта. ' * rng.randint(1, 20),
+                    cooking_time=rng.randint(5, 180),
+                    image=self.options['image'],
+                    pub_date=now - timedelta(
+                        seconds=rng.randint(0, seconds)),
+                ) for number in range(count)
+            ))
+        self.bulk_create(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, rng.randint(1, min(3, len(tags))))
+        ))
+        self.bulk_create(IngredientAmount, (
+            IngredientAmount(recipe_id=recipe, ingredient_id=ingredient,
+                             amount=rng.randint(1, 500))
+            for recipe in recipes
+            for ingredient in self.pick_ingredients(ingredients)
+        ))
+        return recipes
+
+    def pick_ingredients(self, ingredients):
+        picked = set()
+        for _ in range(self.rng.randint(3, 12)):
+            picked.add(ingredients[power_law(
+                self.rng, len(ingredients), 2)])
+        return picked
+
+    def pairs(self, count, left, right, exponent=3, distinct=False):
+        """Unique pairs with power-law activity and popularity."""
+        seen = set()
+        attempts = 0
+        while len(seen) < count and attempts < count * 3:
+            attempts += 1
+            pair = (left[power_law(self.rng, len(left), 2)],
+                    right[power_law(self.rng, len(right), exponent)])
+            if distinct and pair[0] == pair[1]:
+                continue
+            if pair not in seen:
+                seen.add(pair)
+                yield pair
+
+    def create_pairs(self, model, user_field, count, users, recipes):
+        self.bulk_create(model, (
+            model(**{f'{user_field}_id': user, 'recipe_id': recipe})
+            for user, recipe in self.pairs(count, users, recipes)
+        ))
+
+    def create_subscriptions(self, count, users):
+        self.bulk_create(Subscribe, (
+            Subscribe(user_id=user, author_id=author)
+            for user, author in self.pairs(
+                count, users, users, distinct=True)
+        ))
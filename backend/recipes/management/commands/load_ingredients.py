@@ -1,29 +1,126 @@
 import csv
+import json
 import logging
+import time
+from itertools import islice
 from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.versions import bump_after_bulk_load
 from recipes.models import Ingredient
 
 logger = logging.getLogger(__name__)
 
 DIR = Path(settings.BASE_DIR).resolve().joinpath('data')
 FILE = DIR / 'ingredients.csv'
+READ_SIZE = 64 * 1024
+
+
+def read_csv(path):
+    with open(path, 'r', encoding='UTF-8', newline='') as file:
+        for row in csv.reader(file, delimiter=','):
+            if row:
+                yield row[0], row[1]
+
+
+def read_json(path):
+    """Yield objects of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='UTF-8') as file:
+        buffer = file.read(READ_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError(f'{path}: expected a JSON array.')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(READ_SIZE)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            yield item['name'], item['measurement_unit']
+            buffer = buffer[end:]
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
 
 
 class Command(BaseCommand):
     help = 'Import ingredients to database.'
 
-    def handle(self, **kwargs):
-        with open(FILE, 'r', encoding='UTF-8') as file:
-            reader = csv.reader(file, delimiter=',')
-            for row in reader:
-                if Ingredient.objects.filter(name=row[0]).exists():
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', type=Path, default=FILE,
+            help='CSV (name,unit) or JSON array of ingredients.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Show what would change without writing.')
+
+    def handle(self, **options):
+        path = options['file']
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'{path}: unsupported file type.')
+        started = time.perf_counter()
+        rows = batches(reader(path), options['batch_size'])
+        if options['dry_run']:
+            added, present = self.diff(rows)
+        else:
+            added, present = self.load(rows)
+            if added:
+                bump_after_bulk_load('ingredients')
+        logger.info(
+            f'{path.name}: добавлено {added}, уже было {present}, '
+            f'{time.perf_counter() - started:.2f} с'
+            + (' (dry run)' if options['dry_run'] else '')
+        )
+
+    @transaction.atomic
+    def load(self, rows):
+        before = Ingredient.objects.count()
+        total = 0
+        for batch in rows:
+            total += len(batch)
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in batch),
+                ignore_conflicts=True,
+            )
+        added = Ingredient.objects.count() - before
+        return added, total - added
+
+    def diff(self, rows):
+        added = present = 0
+        for batch in rows:
+            existing = dict(Ingredient.objects.filter(
+                name__in=[name for name, _ in batch]
+            ).values_list('name', 'measurement_unit'))
+            for name, unit in batch:
+                if name not in existing:
+                    added += 1
+                    existing[name] = unit
+                    self.stdout.write(f'+ {name} ({unit})')
                     continue
-                Ingredient.objects.get_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
-                )
-                logger.info(f'Запись сохранена: {row}')
+                present += 1
+                if existing[name] != unit:
+                    self.stdout.write(
+                        f'~ {name} ({existing[name]} -> {unit}), '
+                        'не обновляется')
+        return added, present
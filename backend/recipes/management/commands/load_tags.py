@@ -2,6 +2,7 @@ import logging
 
 from django.core.management.base import BaseCommand
 
+from api.versions import bump_after_bulk_load
 from recipes.models import Tag
 
 logger = logging.getLogger(__name__)
@@ -29,10 +30,10 @@ class Command(BaseCommand):
     help = 'Import tags to database.'
 
     def handle(self, **kwargs):
-        for data in tags:
-            Tag.objects.get_or_create(
-                name=data['name'],
-                color=data['color'],
-                slug=data['slug']
-            )
-            logger.info(f'Запись сохранена: {data}')
+        before = Tag.objects.count()
+        Tag.objects.bulk_create(
+            (Tag(**data) for data in tags), ignore_conflicts=True)
+        added = Tag.objects.count() - before
+        if added:
+            bump_after_bulk_load('tags')
+        logger.info(f'Тегов добавлено: {added}')
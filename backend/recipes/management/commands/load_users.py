@@ -1,6 +1,7 @@
 import logging
 
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.core.management.base import BaseCommand
 
 User = get_user_model()
@@ -25,15 +26,14 @@ users = [
 
 
 class Command(BaseCommand):
-    help = 'Import tags to database.'
+    help = 'Import users to database.'
 
     def handle(self, **kwargs):
-        for data in users:
-            User.objects.get_or_create(
-                email=data['email'],
-                username=data['username'],
-                first_name=data['first_name'],
-                last_name=data['last_name'],
-                password=data['password']
-            )
-            logger.info(f'Запись сохранена: {data}')
+        before = User.objects.count()
+        User.objects.bulk_create(
+            (User(**{**data, 'password': make_password(data['password'])})
+             for data in users),
+            ignore_conflicts=True,
+        )
+        logger.info(
+            f'Пользователей добавлено: {User.objects.count() - before}')
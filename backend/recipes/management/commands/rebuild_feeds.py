@@ -0,0 +1,23 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import backfill
+from recipes.models import FeedEntry, Subscribe
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Refill subscription feeds from the current subscriptions.'
+
+    def handle(self, **kwargs):
+        entries = 0
+        with transaction.atomic():
+            FeedEntry.objects.all().delete()
+            subscriptions = Subscribe.objects.select_related(
+                'user', 'author').iterator()
+            for subscription in subscriptions:
+                entries += backfill(subscription.user, subscription.author)
+        logger.info(f'Записей в лентах: {entries}')
@@ -0,0 +1,19 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import COUNTERS, recount
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized favorites, cart and recipe counters.'
+
+    def handle(self, **kwargs):
+        with transaction.atomic():
+            for model, field, source, relation in COUNTERS:
+                drifted = recount(model, field, source, relation)
+                logger.info(
+                    f'{model.__name__}.{field}: исправлено {drifted}')
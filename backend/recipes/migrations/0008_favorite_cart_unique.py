@@ -0,0 +1,43 @@
+# Generated by Django 3.2 on 2026-10-18 03:08
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+DUPLICATES = (
+    ('Favorite', 'user', 'favorites_count'),
+    ('ShoppingCart', 'author', 'cart_count'),
+)
+
+
+def remove_duplicates(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    for model_name, user_field, counter in DUPLICATES:
+        model = apps.get_model('recipes', model_name)
+        groups = model.objects.values(user_field, 'recipe').annotate(
+            first=Min('id'), rows=Count('id')).filter(rows__gt=1)
+        for group in list(groups):
+            model.objects.filter(
+                recipe=group['recipe'], **{user_field: group[user_field]}
+            ).exclude(id=group['first']).delete()
+            Recipe.objects.filter(pk=group['recipe']).update(
+                **{counter: model.objects.filter(
+                    recipe=group['recipe']).count()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('author', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
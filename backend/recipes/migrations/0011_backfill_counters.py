@@ -0,0 +1,42 @@
+# Generated by Django 3.2 on 2026-10-18 09:20
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    (('recipes', 'Recipe'), 'favorites_count', ('recipes', 'Favorite'),
+     'recipe'),
+    (('recipes', 'Recipe'), 'cart_count', ('recipes', 'ShoppingCart'),
+     'recipe'),
+    (('users', 'User'), 'recipes_count', ('recipes', 'Recipe'), 'author'),
+    (('users', 'User'), 'followers_count', ('recipes', 'Subscribe'),
+     'author'),
+)
+
+
+def backfill_counters(apps, schema_editor):
+    # The counter columns were added with default=0. The aggregation is
+    # inlined rather than shared with recipes.counters so this migration
+    # keeps working whatever that module turns into.
+    for model, field, source, relation in COUNTERS:
+        source = apps.get_model(*source)
+        apps.get_model(*model).objects.update(**{field: Coalesce(Subquery(
+            source.objects.filter(
+                **{relation: OuterRef('pk')}
+            ).order_by().values(relation).annotate(
+                count=Count('pk')
+            ).values('count')
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_author_pub_date_idx'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
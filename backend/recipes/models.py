@@ -1,9 +1,18 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connection, connections, models, router
+from django.db.models import (BooleanField, Case, Exists, F, IntegerField,
+                              OuterRef, Prefetch, Q, Subquery, Value, When)
+from django.db.models.sql import InsertQuery
+from django.utils import timezone
 
 User = get_user_model()
 
+# Must match the text search configuration of the search_vector trigger.
+SEARCH_CONFIG = 'russian'
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -51,6 +60,56 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                author_is_subscribed=Value(
+                    False, output_field=BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                recipe=OuterRef('pk'), user=user)),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                recipe=OuterRef('pk'), author=user)),
+            author_is_subscribed=Exists(Subscribe.objects.filter(
+                author=OuterRef('author'), user=user)),
+        )
+
+    def with_tags(self, tags):
+        """Recipes having any of ``tags``, each exactly once.
+
+        A semi-join on the tags table needs neither a join in the outer
+        query nor ``DISTINCT`` over whole recipe rows.
+        """
+        return self.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__in=tags)))
+
+    def search(self, text):
+        """Recipes matching ``text`` in name or description, best first.
+
+        PostgreSQL uses the trigger-maintained ``search_vector`` and its
+        GIN index; other databases fall back to ``icontains`` and rank
+        name matches above description matches.
+        """
+        if connection.vendor == 'postgresql':
+            query = SearchQuery(text, config=SEARCH_CONFIG,
+                                search_type='websearch')
+            return self.filter(search_vector=query).annotate(
+                rank=SearchRank(F('search_vector'), query)
+            ).order_by('-rank', '-pub_date', '-id')
+        return self.filter(
+            Q(name__icontains=text) | Q(text__icontains=text)
+        ).annotate(rank=Case(
+            When(name__icontains=text, then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )).order_by('-rank', '-pub_date', '-id')
+
+
 class Recipe(models.Model):
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -72,6 +131,12 @@ class Recipe(models.Model):
         upload_to='images/',
         verbose_name='Image',
     )
+    image_renditions = models.JSONField(
+        verbose_name='Image renditions',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     name = models.CharField(
         max_length=50,
         verbose_name='Recipe name',
@@ -87,15 +152,47 @@ class Recipe(models.Model):
         verbose_name='Publication date',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Last change date',
+        auto_now=True,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Search vector',
+        null=True,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='In favorites',
+        default=0,
+        editable=False,
+    )
+    cart_count = models.PositiveIntegerField(
+        verbose_name='In shopping carts',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
         ordering = ('-pub_date', )
+        indexes = [
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
+    @classmethod
+    def touch(cls, **lookups):
+        """Mark matching recipes as changed without sending signals."""
+        return cls.objects.filter(**lookups).update(updated_at=timezone.now())
+
 
 class IngredientAmount(models.Model):
     ingredient = models.ForeignKey(
@@ -128,6 +225,28 @@ class IngredientAmount(models.Model):
         return f'{self.ingredient} ({self.amount})'
 
 
+class LinkQuerySet(models.QuerySet):
+    """Rows linking a user to a recipe or an author at most once."""
+
+    def insert_ignore(self, **values):
+        """Insert a row unless it already exists.
+
+        Returns the number of inserted rows, so the caller learns whether
+        the link is new without a separate lookup.
+        """
+        using = router.db_for_write(self.model)
+        query = InsertQuery(self.model, ignore_conflicts=True)
+        query.insert_values(
+            [field for field in self.model._meta.concrete_fields
+             if not field.primary_key],
+            [self.model(**values)],
+        )
+        with connections[using].cursor() as cursor:
+            for sql, params in query.get_compiler(using).as_sql():
+                cursor.execute(sql, params)
+            return cursor.rowcount
+
+
 class Favorite(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -146,9 +265,16 @@ class Favorite(models.Model):
         auto_now_add=True,
     )
 
+    objects = LinkQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Favorite recipe'
         verbose_name_plural = 'Favorite recipes'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite'),
+        ]
 
     def __str__(self):
         return f'{self.recipe}'
@@ -172,14 +298,45 @@ class ShoppingCart(models.Model):
         auto_now_add=True,
     )
 
+    objects = LinkQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Shopping cart'
         verbose_name_plural = 'Shopping carts'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['author', 'recipe'],
+                name='unique_shopping_cart'),
+        ]
 
     def __str__(self):
         return f'{self.recipe}'
 
 
+class SubscribeQuerySet(LinkQuerySet):
+
+    def with_recipes(self, recipes_limit=None):
+        """Attach at most ``recipes_limit`` recipes of every author.
+
+        The newest recipes of every author are picked by a correlated
+        subquery, so the whole page is fetched with one extra query. The
+        subquery reads the first entries of the ``(author, pub_date)``
+        index; Django 3.2 cannot filter on a ``ROW_NUMBER()`` window.
+        """
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        if recipes_limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).order_by('-pub_date', '-id').values('id')[:recipes_limit]
+            ))
+        return self.select_related('author').prefetch_related(Prefetch(
+            'author__recipe_set',
+            queryset=recipes,
+            to_attr='limited_recipes',
+        ))
+
+
 class Subscribe(models.Model):
     user = models.ForeignKey(
         User,
@@ -194,9 +351,15 @@ class Subscribe(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = SubscribeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Subscribe'
         verbose_name_plural = 'Subscribes'
+        indexes = [
+            models.Index(fields=('user', 'id'),
+                         name='subscribe_user_id_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],
@@ -205,3 +368,51 @@ class Subscribe(models.Model):
 
     def __str__(self):
         return f'User {self.user} subccribed to {self.author}'
+
+
+class FeedEntry(models.Model):
+    """A recipe in the subscription feed of a user.
+
+    Filled when a recipe is published and when a subscription starts,
+    trimmed when it ends; see ``recipes.feed``.
+    """
+
+    user = models.ForeignKey(
+        User,
+        related_name='feed',
+        on_delete=models.CASCADE,
+        verbose_name='User',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='feed_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Recipe',
+    )
+    author = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Author',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Publication date',
+    )
+
+    class Meta:
+        verbose_name = 'Feed entry'
+        verbose_name_plural = 'Feed entries'
+        indexes = [
+            models.Index(fields=('user', '-pub_date', '-recipe'),
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=('user', 'author'),
+                         name='feed_user_author_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} in feed of {self.user}'
@@ -0,0 +1,85 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_RENDITION_WORKERS,
+        thread_name_prefix='renditions',
+    )
+
+
+def rendition_name(name, key, image_format):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'images/renditions/{stem}_{key}.{FORMATS[image_format]}'
+
+
+def render(name):
+    """Write every configured rendition of a stored image.
+
+    Returns a mapping of rendition key to storage name, plus the source
+    name under ``source`` so stale renditions can be detected.
+    """
+    renditions = {'source': name}
+    with default_storage.open(name) as file, Image.open(file) as image:
+        image.load()
+        for key, options in settings.IMAGE_RENDITIONS.items():
+            rendition = image.copy()
+            rendition.thumbnail(options['size'])
+            if options['format'] == 'JPEG' and rendition.mode != 'RGB':
+                rendition = rendition.convert('RGB')
+            target = rendition_name(name, key, options['format'])
+            content = ContentFile(b'')
+            rendition.save(content, format=options['format'],
+                           quality=options.get('quality', 80))
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            renditions[key] = default_storage.save(target, content)
+    return renditions
+
+
+def build(recipe_id, name):
+    try:
+        renditions = render(name)
+        Recipe.objects.filter(pk=recipe_id, image=name).update(
+            image_renditions=renditions, updated_at=timezone.now())
+        return renditions
+    except Exception:
+        logger.exception(f'Не удалось обработать изображение {name}')
+        return None
+    finally:
+        if settings.IMAGE_RENDITIONS_ASYNC:
+            connection.close()
+
+
+def schedule(recipe):
+    """Build renditions off the request thread once the save commits."""
+    recipe_id, name = recipe.pk, recipe.image.name
+
+    def submit():
+        if settings.IMAGE_RENDITIONS_ASYNC:
+            get_executor().submit(build, recipe_id, name)
+        else:
+            build(recipe_id, name)
+    transaction.on_commit(submit)
+
+
+def needs_renditions(recipe):
+    name = recipe.image.name
+    return bool(name) and recipe.image_renditions.get('source') != name
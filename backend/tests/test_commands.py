@@ -0,0 +1,88 @@
+import io
+import json
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase
+
+from api.coverage import coverage_index
+from api.search import ingredient_index
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            Subscribe)
+
+User = get_user_model()
+
+
+class LoadIngredientsTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load_csv_idempotent(self):
+        '''Test csv load skips rows that are already present.'''
+
+        file = self.path / 'ingredients.csv'
+        file.write_text('соль,г\n"молоко 3,2%",мл\nсоль,г\n',
+                        encoding='UTF-8')
+        call_command('load_ingredients', file=file, batch_size=1)
+        call_command('load_ingredients', file=file)
+        self.assertEqual(
+            list(Ingredient.objects.values_list('name', 'measurement_unit')),
+            [('молоко 3,2%', 'мл'), ('соль', 'г')])
+
+    def test_load_refreshes_index(self):
+        '''Test loaded ingredients reach the in-process search index.'''
+
+        self.assertEqual(ingredient_index.search('соль'), [])
+        file = self.path / 'ingredients.csv'
+        file.write_text('соль,г\n', encoding='UTF-8')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('load_ingredients', file=file)
+        self.assertEqual(
+            [row['name'] for row in ingredient_index.search('соль')],
+            ['соль'])
+
+    def test_load_json_dry_run(self):
+        '''Test json dry run writes nothing.'''
+
+        file = self.path / 'ingredients.json'
+        file.write_text(json.dumps(
+            [{'name': 'соль', 'measurement_unit': 'г'}]), encoding='UTF-8')
+        call_command('load_ingredients', file=file, dry_run=True,
+                     stdout=io.StringIO())
+        self.assertFalse(Ingredient.objects.exists())
+        call_command('load_ingredients', file=file)
+        self.assertTrue(Ingredient.objects.filter(name='соль').exists())
+
+
+class GenerateDatasetTestCase(TestCase):
+
+    def test_generate_dataset(self):
+        '''Test dataset generator creates consistent rows.'''
+
+        call_command('load_tags')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ingredient {number}', measurement_unit='г')
+            for number in range(20))
+        coverage_index.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('generate_dataset', users=10, recipes=30,
+                         favorites=40, carts=20, subscriptions=15,
+                         chunk_size=7)
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertFalse(Subscribe.objects.filter(
+            user=F('author')).exists())
+        self.assertEqual(
+            sum(Recipe.objects.values_list('favorites_count', flat=True)),
+            Favorite.objects.count())
+        _, sizes = coverage_index.get()
+        self.assertEqual(sum(sizes.values()),
+                         IngredientAmount.objects.count())
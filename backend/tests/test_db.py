@@ -0,0 +1,116 @@
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import SimpleTestCase
+
+from foodgram.db import pool
+
+
+def make_wrapper(directory, alias, **overrides):
+    engine = 'foodgram.db.sqlite3'
+    settings_dict = dict(
+        connection.settings_dict, ENGINE=engine,
+        NAME=str(Path(directory) / 'db.sqlite3'), **overrides)
+    return load_backend(engine).DatabaseWrapper(settings_dict, alias)
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(pool.POOLS.clear)
+
+    def wrapper(self, alias='pool-test', **options):
+        return make_wrapper(
+            self.directory.name, alias, CONN_MAX_AGE=0,
+            POOL=dict({'MAX_SIZE': 1, 'WAIT_TIMEOUT': 0.01}, **options))
+
+    def test_connection_reused(self):
+        '''Test closed connections go back to the pool and are reused.'''
+
+        database = self.wrapper()
+        for _ in range(3):
+            with database.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            database.close_if_unusable_or_obsolete()
+        stats = pool.pool_stats()['pool-test']
+        self.assertEqual(
+            (stats['created'], stats['reused'], stats['idle'],
+             stats['in_use']),
+            (1, 2, 1, 0))
+
+    def test_wait_timeout(self):
+        '''Test acquire fails when every connection is in use.'''
+
+        first, second = self.wrapper(), self.wrapper()
+        first.ensure_connection()
+        with self.assertRaises(pool.PoolTimeout):
+            second.ensure_connection()
+        first.close()
+        second.ensure_connection()
+        stats = pool.pool_stats()['pool-test']
+        self.assertEqual((stats['timeouts'], stats['reused']), (1, 1))
+
+    def test_broken_and_expired_dropped(self):
+        '''Test connections failing the ping or idle too long are closed.'''
+
+        database = self.wrapper(MAX_SIZE=2, IDLE_TIMEOUT=60)
+        database.ensure_connection()
+        database.close()
+        with mock.patch.object(pool.POOLS['pool-test'], 'ping',
+                               return_value=False):
+            database.ensure_connection()
+        database.close()
+        with mock.patch('time.monotonic', return_value=10 ** 9):
+            database.ensure_connection()
+        database.close()
+        stats = pool.pool_stats()['pool-test']
+        self.assertEqual(
+            (stats['created'], stats['broken'], stats['closed'],
+             stats['idle']),
+            (3, 1, 1, 1))
+
+
+class HealthCheckTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.database = make_wrapper(
+            self.directory.name, 'health-test', CONN_MAX_AGE=None,
+            HEALTH_CHECKS=True, POOL={})
+        self.addCleanup(self.database.close)
+
+    def request(self, queries):
+        self.database.close_if_unusable_or_obsolete()
+        for _ in range(queries):
+            with self.database.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        self.database.close_if_unusable_or_obsolete()
+
+    def test_checked_before_first_query(self):
+        '''Test a kept connection is checked once, before its first query.'''
+
+        self.request(1)
+        connection = self.database.connection
+        with mock.patch.object(self.database, 'is_usable',
+                               return_value=True) as is_usable:
+            self.request(0)
+            self.assertEqual(is_usable.call_count, 0)
+            self.request(3)
+            self.assertEqual(is_usable.call_count, 1)
+        self.assertIs(self.database.connection, connection)
+
+    def test_broken_connection_replaced(self):
+        '''Test a kept connection failing the check is reopened.'''
+
+        self.request(1)
+        connection = self.database.connection
+        with mock.patch.object(self.database, 'is_usable',
+                               return_value=False):
+            self.request(1)
+        self.assertIsNot(self.database.connection, connection)
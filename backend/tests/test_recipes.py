@@ -0,0 +1,933 @@
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+from http import HTTPStatus
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from api.coverage import coverage_index
+from api.fields import Base64ImageField
+from api.fragments import build_fragments, overlay, render_recipes
+from api.paginations import Paginator
+from api.serializers import RecipeReadOnlySerializer
+from api.versions import get_version
+from recipes import feed
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientAmount, Recipe, ShoppingCart,
+                            Subscribe, Tag)
+
+User = get_user_model()
+
+
+class RecipesTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@ya.ru',
+            username='user',
+            first_name='user',
+            last_name='user',
+            password='123user23sdf13'
+        )
+        cls.author = User.objects.create_user(
+            email='author@ya.ru',
+            username='author',
+            first_name='author',
+            last_name='author',
+            password='123user23sdf13'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tags = [
+            Tag.objects.create(name='Завтрак', color='#E26C2D',
+                               slug='breakfast'),
+            Tag.objects.create(name='Обед', color='#49B64E', slug='lunch'),
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name='соль', measurement_unit='г'),
+            Ingredient.objects.create(name='сахар', measurement_unit='г'),
+            Ingredient.objects.create(name='молоко', measurement_unit='мл'),
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION='token ' + self.token.key)
+
+    def create_recipes(self, count, author=None):
+        recipes = []
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=author or self.author,
+                name=f'recipe {number}',
+                text='text',
+                cooking_time=10,
+                image='images/recipe.png',
+            )
+            recipe.tags.set(self.tags)
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in self.ingredients
+            )
+            recipes.append(recipe)
+        return recipes
+
+    def test_recipe_list_flags(self):
+        '''Test per-user flags in the recipe list.'''
+
+        recipe = self.create_recipes(1)[0]
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        ShoppingCart.objects.create(author=self.user, recipe=recipe)
+        Subscribe.objects.create(user=self.user, author=self.author)
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        result = response.data['results'][0]
+        self.assertTrue(result['is_favorited'])
+        self.assertTrue(result['is_in_shopping_cart'])
+        self.assertTrue(result['author']['is_subscribed'])
+        self.assertEqual(len(result['tags']), 2)
+        self.assertEqual(len(result['ingredients']), 3)
+
+    def test_recipe_list_anonymous(self):
+        '''Test anonymous user gets false flags.'''
+
+        self.create_recipes(1)
+        self.client.credentials()
+        response = self.client.get('/api/recipes/')
+        result = response.data['results'][0]
+        self.assertFalse(result['is_favorited'])
+        self.assertFalse(result['is_in_shopping_cart'])
+        self.assertFalse(result['author']['is_subscribed'])
+
+    def test_recipe_list_constant_queries(self):
+        '''Test recipe list costs the same queries for any page size.'''
+
+        self.create_recipes(10)
+        # token, count, page, tags, ingredient amounts
+        with self.assertNumQueries(5):
+            self.client.get('/api/recipes/?limit=2')
+        with self.assertNumQueries(5):
+            self.client.get('/api/recipes/?limit=10')
+
+    def test_recipe_detail_constant_queries(self):
+        '''Test recipe detail costs a fixed number of queries.'''
+
+        recipe = self.create_recipes(1)[0]
+        # token, recipe, tags, ingredient amounts
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_download_shopping_cart(self):
+        '''Test shopping list sums amounts in a single query.'''
+
+        for recipe in self.create_recipes(3):
+            ShoppingCart.objects.create(author=self.user, recipe=recipe)
+        # token, aggregated ingredients
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/')
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertIn('соль (6) - г', content)
+        self.assertIn('молоко (6) - мл', content)
+
+    def test_download_shopping_cart_formats(self):
+        '''Test shopping list csv and pdf formats.'''
+
+        ShoppingCart.objects.create(author=self.user,
+                                    recipe=self.create_recipes(1)[0])
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=csv')
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines()[1], 'молоко,1,мл')
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=pdf',
+            HTTP_ACCEPT='application/json')
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=xml')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_subscriptions_recipes_limit(self):
+        '''Test subscriptions page honours recipes_limit.'''
+
+        self.create_recipes(5)
+        second_author = User.objects.create_user(
+            email='second@ya.ru', username='second', password='123user23sdf13')
+        self.create_recipes(2, author=second_author)
+        Subscribe.objects.create(user=self.user, author=self.author)
+        Subscribe.objects.create(user=self.user, author=second_author)
+        call_command('recount_counters')
+        # token, count, page, limited recipes
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                '/api/users/subscriptions/?recipes_limit=3')
+        results = response.data['results']
+        self.assertEqual(results[0]['recipes_count'], 5)
+        self.assertEqual(len(results[0]['recipes']), 3)
+        self.assertEqual(results[0]['recipes'][0]['name'], 'recipe 4')
+        self.assertEqual(len(results[1]['recipes']), 2)
+        self.assertTrue(results[1]['is_subscribed'])
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=many')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_ingredient_search(self):
+        '''Test ingredient search answers from the index.'''
+
+        Ingredient.objects.create(name='смородина', measurement_unit='г')
+        self.client.credentials()
+        self.client.get('/api/ingredients/?name=мо')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/?name=МО')
+        self.assertEqual([row['name'] for row in response.data],
+                         ['молоко', 'смородина'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='морковь', measurement_unit='г')
+        response = self.client.get('/api/ingredients/?name=мо')
+        self.assertEqual([row['name'] for row in response.data],
+                         ['молоко', 'морковь', 'смородина'])
+        response = self.client.get('/api/ingredients/?name=лок')
+        self.assertEqual([row['name'] for row in response.data], ['молоко'])
+
+    def test_reference_snapshots(self):
+        '''Test tags and ingredients are served from ETag snapshots.'''
+
+        self.client.credentials()
+        response = self.client.get('/api/tags/')
+        etag = response['ETag']
+        self.assertEqual(len(response.json()), 2)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+            # The version changes only once the transaction commits.
+            response = self.client.get(
+                '/api/tags/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.json()), 3)
+        response = self.client.get('/api/ingredients/')
+        self.assertEqual(
+            [row['name'] for row in response.json()],
+            [ingredient.name for ingredient in Ingredient.objects.all()])
+
+    def test_recipe_conditional_get(self):
+        '''Test recipe detail and list answer conditional requests.'''
+
+        recipe = self.create_recipes(1)[0]
+        url = f'/api/recipes/{recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        # token, recipe
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        etag = response['ETag']
+        amount = recipe.recipe_amount.first()
+        amount.amount = 100
+        amount.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        etag = response['ETag']
+        recipe.tags.remove(self.tags[0])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+        etag = self.client.get('/api/recipes/')['ETag']
+        # token, count, page
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+        # Author edits change the body but not the recipe, so only the
+        # ETag validates it.
+        self.client.credentials()
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        User.objects.filter(pk=self.author.pk).update(first_name='Renamed')
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag,
+            HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_counters(self):
+        '''Test denormalized counters follow user actions.'''
+
+        recipe = self.create_recipes(1)[0]
+        self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.cart_count, 1)
+        self.assertEqual(self.author.followers_count, 1)
+        self.client.delete(f'/api/recipes/{recipe.id}/favorite/')
+        self.client.delete(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(recipe.cart_count, 0)
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_recount_counters(self):
+        '''Test recount_counters repairs drifted counters.'''
+
+        recipe = self.create_recipes(2)[0]
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        Recipe.objects.filter(pk=recipe.pk).update(cart_count=5)
+        call_command('recount_counters')
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.cart_count, 0)
+        self.assertEqual(self.author.recipes_count, 2)
+
+    def test_recipe_cursor_pagination(self):
+        '''Test opt-in cursor pagination walks the filtered feed.'''
+
+        recipes = self.create_recipes(5)
+        recipes[0].tags.set([self.tags[1]])
+        response = self.client.get(
+            '/api/recipes/?pagination=cursor&limit=2&tags=breakfast')
+        self.assertNotIn('count', response.data)
+        names = [recipe['name'] for recipe in response.data['results']]
+        next_link = response.data['next']
+        self.assertIn('limit=2', next_link)
+        # token, tag filter, page, tags, ingredient amounts
+        with self.assertNumQueries(5):
+            response = self.client.get(next_link)
+        names += [recipe['name'] for recipe in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(
+            names, ['recipe 4', 'recipe 3', 'recipe 2', 'recipe 1'])
+
+    def test_recipe_cursor_same_pub_date(self):
+        '''Test cursor pages of recipes sharing a pub_date.'''
+
+        recipes = self.create_recipes(5)
+        Recipe.objects.update(pub_date=recipes[0].pub_date)
+        url = '/api/recipes/?pagination=cursor&limit=2'
+        names = []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertFalse(any('OFFSET' in query['sql']
+                                 for query in context.captured_queries))
+            names += [recipe['name'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(names, [f'recipe {number}'
+                                 for number in range(4, -1, -1)])
+
+    def test_subscriptions_cursor_pagination(self):
+        '''Test opt-in cursor pagination of subscriptions.'''
+
+        for number in range(3):
+            author = User.objects.create_user(
+                email=f'author{number}@ya.ru', username=f'author{number}',
+                password='123user23sdf13')
+            Subscribe.objects.create(user=self.user, author=author)
+        response = self.client.get(
+            '/api/users/subscriptions/?pagination=cursor&limit=2')
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [author['username'] for author in response.data['results']],
+            ['author2'])
+
+    def test_metrics(self):
+        '''Test per-request timings and the metrics endpoint.'''
+
+        self.create_recipes(1)
+        response = self.client.get('/api/recipes/')
+        self.assertIn('desc="5 queries"', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+        admin = User.objects.create_superuser(
+            email='admin@ya.ru', username='admin', password='123user23sdf13')
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/metrics')
+        self.assertContains(
+            response,
+            'foodgram_request_queries_count{view="RecipeViewSet.list"}')
+        self.assertContains(
+            response,
+            'foodgram_request_duration_seconds_bucket{view="RecipeViewSet'
+            '.list",stage="db",le="+Inf"}')
+
+    def test_recipe_search(self):
+        '''Test search ranks name matches above description matches.'''
+
+        first, second, third = self.create_recipes(3)
+        Recipe.objects.filter(pk=first.pk).update(
+            name='pancakes', text='flour and milk')
+        Recipe.objects.filter(pk=second.pk).update(
+            name='porridge', text='served with pancakes')
+        third.tags.set([self.tags[1]])
+        Recipe.objects.filter(pk=third.pk).update(name='big pancakes')
+        response = self.client.get('/api/recipes/?search=pancakes')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [third.id, first.id, second.id])
+        response = self.client.get(
+            '/api/recipes/?search=pancakes&tags=breakfast')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [first.id, second.id])
+
+    def test_ingredient_coverage(self):
+        '''Test recipes ranked by the number of missing ingredients.'''
+
+        salt, sugar, milk = self.ingredients
+        recipes = self.create_recipes(4)
+        IngredientAmount.objects.filter(recipe=recipes[0]).exclude(
+            ingredient=salt).delete()
+        IngredientAmount.objects.filter(recipe=recipes[1]).filter(
+            ingredient=milk).delete()
+        IngredientAmount.objects.filter(recipe=recipes[3]).exclude(
+            ingredient=milk).delete()
+        response = self.client.get(
+            f'/api/recipes/?ingredients={salt.id},{sugar.id}')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipes[1].id, recipes[0].id, recipes[2].id])
+
+        Recipe.objects.filter(pk=recipes[3].pk).update(
+            image_renditions={'source': 'images/recipe.png'})
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipes[3].id}/',
+                {'name': 'salted', 'text': 'text', 'cooking_time': 5,
+                 'tags': [self.tags[0].id],
+                 'ingredients': [{'id': salt.id, 'amount': 1}]},
+                format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(coverage_index._version,
+                         get_version('recipe_ingredients'))
+        response = self.client.get(f'/api/recipes/?ingredients={salt.id}')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipes[3].id, recipes[0].id, recipes[1].id, recipes[2].id])
+
+    def test_ingredient_coverage_combined(self):
+        '''Test coverage ranks only filtered recipes and ignores cursors.'''
+
+        salt = self.ingredients[0]
+        recipes = self.create_recipes(4)
+        other = User.objects.create_user(
+            email='other@ya.ru', username='other', password='123user23sdf13')
+        Recipe.objects.filter(pk__in=[recipes[1].pk, recipes[3].pk]).update(
+            author=other)
+        with mock.patch('api.filters.COVERAGE_RESULTS', 2):
+            response = self.client.get(
+                f'/api/recipes/?ingredients={salt.id}&author={other.id}'
+                '&pagination=cursor')
+        self.assertIn('count', response.data)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipes[3].id, recipes[1].id])
+
+    def test_coverage_bumped_once_per_recipe(self):
+        '''Test a recipe update or delete bumps the index version once.'''
+
+        salt = self.ingredients[0]
+        recipe = self.create_recipes(1)[0]
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image_renditions={'source': 'images/recipe.png'})
+        User.objects.filter(pk=self.author.pk).update(recipes_count=1)
+        coverage_index.get()
+        version = get_version('recipe_ingredients')
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f'/api/recipes/{recipe.id}/',
+                {'name': 'salted', 'text': 'text', 'cooking_time': 5,
+                 'tags': [self.tags[0].id],
+                 'ingredients': [{'id': salt.id, 'amount': 1}]},
+                format='json')
+        self.assertEqual(get_version('recipe_ingredients'), version + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(get_version('recipe_ingredients'), version + 2)
+        self.assertEqual(coverage_index._version, version + 2)
+        self.assertEqual(coverage_index.rank([salt.id], 10), [])
+
+    def test_tags_filter(self):
+        '''Test filtering by several tags without duplicates or DISTINCT.'''
+
+        first, second = self.create_recipes(2)
+        second.tags.set([self.tags[1]])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                '/api/recipes/?tags=breakfast&tags=lunch')
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [second.id, first.id])
+        statements = [query['sql'].upper()
+                      for query in context.captured_queries
+                      if 'RECIPES_RECIPE_TAGS' in query['sql'].upper()
+                      and 'FROM "RECIPES_RECIPE"' in query['sql'].upper()]
+        self.assertEqual(len(statements), 2)
+        for sql in statements:
+            self.assertNotIn('DISTINCT', sql)
+            self.assertIn('EXISTS', sql)
+            self.assertNotIn('JOIN "RECIPES_RECIPE_TAGS"', sql)
+        response = self.client.get('/api/recipes/?tags=breakfast')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [first.id])
+
+    def test_update_writes_only_changed_ingredients(self):
+        '''Test recipe update writes only the changed ingredient rows.'''
+
+        salt, sugar, milk = self.ingredients
+        recipe = self.create_recipes(1)[0]
+        IngredientAmount.objects.filter(
+            recipe=recipe, ingredient=milk).delete()
+        kept = IngredientAmount.objects.get(recipe=recipe, ingredient=salt)
+        self.client.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/',
+                {'name': 'edited', 'text': 'text', 'cooking_time': 5,
+                 'tags': [tag.id for tag in self.tags],
+                 'ingredients': [{'id': salt.id, 'amount': 1},
+                                 {'id': milk.id, 'amount': 7}]},
+                format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        # One statement per changed ingredient row, then the recipe.
+        self.assertEqual(write_statements(context), [
+            'DELETE FROM "recipes_ingredientamount"',
+            'INSERT INTO "recipes_ingredientamount"',
+            'UPDATE "recipes_recipe"',
+        ])
+        self.assertEqual(
+            IngredientAmount.objects.get(pk=kept.pk).amount, kept.amount)
+        self.assertEqual(
+            dict(recipe.recipe_amount.values_list('ingredient', 'amount')),
+            {salt.id: 1, milk.id: 7})
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.patch(
+                f'/api/recipes/{recipe.id}/',
+                {'name': 'edited', 'text': 'text', 'cooking_time': 5,
+                 'tags': [tag.id for tag in self.tags],
+                 'ingredients': [{'id': salt.id, 'amount': 1},
+                                 {'id': milk.id, 'amount': 8}]},
+                format='json')
+        self.assertEqual(write_statements(context), [
+            'UPDATE "recipes_ingredientamount"',
+            'UPDATE "recipes_recipe"',
+        ])
+        self.assertEqual(
+            recipe.recipe_amount.get(ingredient=milk).amount, 8)
+
+    def test_write_resolves_ids_in_bulk(self):
+        '''Test ingredient and tag ids are resolved with one query each.'''
+
+        recipe = self.create_recipes(1)[0]
+        self.client.force_authenticate(self.author)
+        payload = {
+            'name': 'edited', 'text': 'text', 'cooking_time': 5,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [{'id': ingredient.id, 'amount': 2}
+                            for ingredient in self.ingredients],
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', payload, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        for table in ('recipes_ingredient', 'recipes_tag'):
+            lookups = [query for query in context.captured_queries
+                       if query['sql'].startswith('SELECT')
+                       and f'FROM "{table}" WHERE' in query['sql']]
+            self.assertEqual(len(lookups), 1, table)
+
+        payload['tags'] = [self.tags[0].id, 998, 999]
+        payload['ingredients'] += [{'id': 9999, 'amount': 1},
+                                   {'id': 9998, 'amount': 1}]
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/', payload, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(response.data['tags'],
+                         ['Objects do not exist: 998, 999.'])
+        self.assertEqual(response.data['ingredients'],
+                         ['Objects do not exist: 9999, 9998.'])
+
+        payload['tags'] = [self.tags[0].id, None, 999]
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/', payload, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(response.data['tags'],
+                         ['This field may not be null.'])
+
+    def test_favorite_and_cart_toggles(self):
+        '''Test adding and removing are one write each and never duplicate.'''
+
+        recipe = self.create_recipes(1)[0]
+        for action in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{recipe.id}/{action}/'
+            # Token, recipe, insert and counter.
+            with self.assertNumQueries(4):
+                response = self.client.post(url)
+            self.assertEqual(response.status_code, HTTPStatus.CREATED)
+            self.assertEqual(response.data['id'], recipe.id)
+            response = self.client.post(url)
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+            # Token, delete and counter.
+            with self.assertNumQueries(3):
+                response = self.client.delete(url)
+            self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+            response = self.client.delete(url)
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertFalse(Favorite.objects.exists())
+        self.assertFalse(ShoppingCart.objects.exists())
+        response = self.client.post('/api/recipes/0/favorite/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code,
+                         HTTPStatus.CREATED)
+        self.assertEqual(self.client.post(url).status_code,
+                         HTTPStatus.BAD_REQUEST)
+        self.assertEqual(Subscribe.objects.count(), 1)
+        self.assertEqual(self.client.delete(url).status_code,
+                         HTTPStatus.NO_CONTENT)
+        self.assertEqual(self.client.delete(url).status_code,
+                         HTTPStatus.BAD_REQUEST)
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(recipe.cart_count, 0)
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_bulk_cart_and_favorites(self):
+        '''Test adding and removing several recipes in one request.'''
+
+        first, second, third = self.create_recipes(3)
+        ShoppingCart.objects.create(author=self.user, recipe=first)
+        Recipe.objects.filter(pk=first.pk).update(cart_count=1)
+        # Token, ids and state, insert and counters, plus the savepoint.
+        with self.assertNumQueries(6):
+            response = self.client.post(
+                '/api/recipes/shopping_cart/',
+                {'recipes': [first.id, second.id, third.id]}, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data, {'added': [second.id, third.id]})
+        self.assertEqual(self.user.cart.count(), 3)
+        response = self.client.delete(
+            '/api/recipes/shopping_cart/',
+            {'recipes': [first.id, third.id]}, format='json')
+        self.assertEqual(response.data, {'removed': [first.id, third.id]})
+        self.assertEqual(
+            list(self.user.cart.values_list('recipe', flat=True)),
+            [second.id])
+        second.refresh_from_db()
+        self.assertEqual(second.cart_count, 1)
+
+        response = self.client.post(
+            '/api/recipes/favorite/',
+            {'recipes': [first.id, 9998, 9999]}, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(response.data['recipes'],
+                         ['Objects do not exist: 9998, 9999.'])
+        self.assertFalse(Favorite.objects.exists())
+        response = self.client.post(
+            '/api/recipes/favorite/', {'recipes': [first.id]}, format='json')
+        self.assertEqual(response.data, {'added': [first.id]})
+
+    def test_subscription_feed(self):
+        '''Test the feed is filled, trimmed and paginated by keyset.'''
+
+        old = self.create_recipes(2)
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.client.post(url)
+        response = self.client.get('/api/users/feed/')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [old[1].id, old[0].id])
+        self.assertTrue(response.data['results'][0]['author']['is_subscribed'])
+
+        new = self.create_recipes(3)
+        for recipe in new:
+            self.assertEqual(feed.fan_out(recipe), 1)
+        response = self.client.get('/api/users/feed/?limit=3')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [new[2].id, new[1].id, new[0].id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [old[1].id, old[0].id])
+        self.assertIsNone(response.data['next'])
+
+        self.client.delete(url)
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.client.get('/api/users/feed/')
+        self.assertEqual(response.data['results'], [])
+
+    @override_settings(FEED_FANOUT_LIMIT=10)
+    def test_subscription_feed_broadcast_author(self):
+        '''Test recipes of popular authors are merged in on read.'''
+
+        other = User.objects.create_user(
+            email='other@ya.ru', username='other', password='123user23sdf13')
+        User.objects.filter(pk__in=(self.author.pk, other.pk)).update(
+            followers_count=100)
+        Subscribe.objects.create(user=self.user, author=other)
+        theirs = self.create_recipes(1, author=other)[0]
+        FeedEntry.objects.create(user=self.user, recipe=theirs, author=other,
+                                 pub_date=theirs.pub_date)
+        ours = self.create_recipes(2)
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertFalse(FeedEntry.objects.filter(author=self.author))
+        ours[1].author.refresh_from_db()
+        self.assertEqual(feed.fan_out(ours[1]), 0)
+        response = self.client.get('/api/users/feed/?limit=2')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [ours[1].id, ours[0].id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [theirs.id])
+
+    def test_recipe_fragment_cache(self):
+        '''Test cached recipe fragments, their invalidation and flags.'''
+
+        recipe = self.create_recipes(1)[0]
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        fresh = self.client.get('/api/recipes/').data['results']
+        # token, count, page: tags and ingredients come from the cache
+        with self.assertNumQueries(3):
+            cached = self.client.get('/api/recipes/').data['results']
+        self.assertEqual(cached, fresh)
+        self.assertTrue(cached[0]['is_favorited'])
+        self.assertTrue(cached[0]['image'].startswith('http://testserver/'))
+
+        self.client.force_authenticate(self.author)
+        result = self.client.get(f'/api/recipes/{recipe.id}/').data
+        self.assertFalse(result['is_favorited'])
+        self.client.force_authenticate(None)
+        self.client.credentials()
+        result = self.client.get('/api/recipes/').data['results'][0]
+        self.assertFalse(result['is_favorited'])
+        self.assertFalse(result['author']['is_subscribed'])
+
+        self.tags[0].name = 'Завтрак'
+        self.tags[0].save()
+        User.objects.filter(pk=self.author.pk).update(first_name='Иван')
+        IngredientAmount.objects.filter(
+            recipe=recipe, ingredient=self.ingredients[0]).first().delete()
+        result = self.client.get('/api/recipes/').data['results'][0]
+        self.assertIn('Завтрак', [tag['name'] for tag in result['tags']])
+        self.assertEqual(result['author']['first_name'], 'Иван')
+        self.assertEqual(len(result['ingredients']), 2)
+
+    def test_fast_fragments_match_serializer(self):
+        '''Test values()-built recipes render byte-identical JSON.'''
+
+        first, second = self.create_recipes(2)
+        second.tags.set([self.tags[1]])
+        Recipe.objects.filter(pk=second.pk).update(image_renditions={
+            'source': 'images/recipe.png',
+            'small': 'images/renditions/recipe_small.jpg'})
+        Favorite.objects.create(user=self.user, recipe=first)
+        Subscribe.objects.create(user=self.user, author=self.author)
+        request = APIRequestFactory().get('/api/recipes/')
+        request.user = self.user
+        recipes = list(Recipe.objects.select_related(
+            'author'
+        ).prefetch_related('tags', Prefetch(
+            'recipe_amount',
+            queryset=IngredientAmount.objects.select_related(
+                'ingredient').order_by('id'))
+        ).with_user_flags(self.user).order_by('id'))
+        renderer = JSONRenderer()
+        fragments = build_fragments(recipes)
+        self.assertEqual(
+            renderer.render([overlay(fragments[recipe.pk], recipe, None)
+                             for recipe in recipes]),
+            renderer.render(RecipeReadOnlySerializer(
+                recipes, many=True, context={'request': None}).data))
+        expected = renderer.render(RecipeReadOnlySerializer(
+            recipes, many=True, context={'request': request}).data)
+        self.assertEqual(
+            renderer.render(render_recipes(recipes, request)), expected)
+        # Once more from the cache.
+        self.assertEqual(
+            renderer.render(render_recipes(recipes, request)), expected)
+
+    def test_limit_is_capped(self):
+        '''Test ?limit= cannot exceed the configured page size cap.'''
+
+        self.create_recipes(3)
+        with mock.patch.object(Paginator, 'max_page_size', 2):
+            response = self.client.get('/api/recipes/?limit=100000')
+        self.assertEqual(len(response.data['results']), 2)
+
+    @override_settings(STREAM_CHUNK_SIZE=2)
+    def test_staff_streaming_list(self):
+        '''Test staff can stream whole lists as one JSON array.'''
+
+        self.create_recipes(5)
+        response = self.client.get('/api/recipes/?stream=true')
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+        admin = User.objects.create_superuser(
+            email='admin@ya.ru', username='admin', password='123user23sdf13')
+        self.client.force_authenticate(admin)
+        expected = self.client.get('/api/recipes/?limit=100').json()
+        response = self.client.get('/api/recipes/?stream=true')
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            json.loads(b''.join(response.streaming_content)),
+            expected['results'])
+        response = self.client.get(
+            f'/api/recipes/?stream=true&author={admin.id}')
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+        response = self.client.get('/api/users/?stream=true')
+        users = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(users), User.objects.count())
+
+    def test_delete_skips_touch(self):
+        '''Test deleting a recipe does not touch it per ingredient row.'''
+
+        recipe = self.create_recipes(1)[0]
+        User.objects.filter(pk=self.author.pk).update(recipes_count=1)
+        self.client.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertEqual(
+            [query['sql'] for query in context.captured_queries
+             if query['sql'].startswith('UPDATE "recipes_recipe"')], [])
+        self.assertFalse(IngredientAmount.objects.filter(
+            recipe_id=recipe.id).exists())
+
+
+def write_statements(context):
+    return [' '.join(query['sql'].split()[:3]).replace(' SET', '')
+            for query in context.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+
+
+def make_image(size=(900, 600), image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, format=image_format)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/{image_format.lower()};base64,{encoded}'
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(),
+                   IMAGE_RENDITIONS_ASYNC=False)
+class RecipeImageTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@ya.ru', username='user', password='123user23sdf13')
+        cls.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, image=None):
+        return self.client.post('/api/recipes/', {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+            'tags': [self.tag.id],
+            'image': image or make_image(),
+            'name': 'recipe',
+            'text': 'text',
+            'cooking_time': 5,
+        }, format='json')
+
+    def test_image_renditions(self):
+        '''Test renditions are built after a recipe is created.'''
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_recipe()
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        recipe = Recipe.objects.get()
+        self.assertEqual(
+            set(recipe.image_renditions),
+            {'source', 'small', 'medium', 'webp'})
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        renditions = response.data['image_renditions']
+        self.assertTrue(renditions['webp'].endswith('.webp'))
+        self.assertTrue(renditions['small'].startswith('http://'))
+        response = self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertIn('medium', response.data['image_renditions'])
+
+    def test_image_too_large(self):
+        '''Test oversized images are refused before decoding.'''
+
+        with override_settings(MAX_IMAGE_SIZE=1024):
+            response = self.create_recipe()
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('image', response.data)
+        with override_settings(MAX_IMAGE_PIXELS=100):
+            response = self.create_recipe()
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.create_recipe(image='data:image/png;base64,AAAA')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        with override_settings(MAX_REQUEST_BODY_SIZE=1024):
+            response = self.create_recipe()
+        self.assertEqual(response.status_code,
+                         HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+    def test_image_decoding_memory(self):
+        '''Test decoding memory does not grow with the image size.'''
+
+        noise = Image.frombytes('RGB', (1000, 1000), os.urandom(3_000_000))
+        buffer = io.BytesIO()
+        noise.save(buffer, format='PNG')
+        data = base64.b64encode(buffer.getvalue()).decode()
+        field = Base64ImageField()
+        tracemalloc.start()
+        try:
+            file = field.to_internal_value(data)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(file.size, len(buffer.getvalue()))
+        self.assertTrue(file.name.endswith('.png'))
+        self.assertLess(peak, len(buffer.getvalue()) // 10)
+        file.close()
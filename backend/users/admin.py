@@ -6,6 +6,7 @@ User = get_user_model()
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'username', 'email', )
+    list_display = ('pk', 'username', 'email',
+                    'recipes_count', 'followers_count')
     search_fields = ('username',)
     list_editable = ('username', 'email',)
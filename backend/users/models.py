@@ -13,6 +13,16 @@ class User(AbstractUser):
         unique=True,
         max_length=254
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Recipes',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Followers',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('id',)